@@ -0,0 +1,193 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = '?!.,;: '
+
+# question key -> (stored_at, sql)
+_SQL_CACHE = OrderedDict()
+
+# (db_host, db_port, db_name, sql) -> (stored_at, rows)
+_RESULT_CACHE = OrderedDict()
+
+# prompt key -> (stored_at, response text)
+_RESPONSE_CACHE = OrderedDict()
+
+# Guards the in-memory caches above; lookups reorder and evict, so even
+# reads mutate them and questions run on several threads at once
+_CACHE_LOCK = threading.Lock()
+
+# Optional on-disk SQL cache shared across processes, keyed by path
+_SQL_STORES = {}
+_SQL_STORES_LOCK = threading.Lock()
+
+# Last (schema, digest) pair. get_schema hands out the same cached dict until
+# it is reloaded, so an identity check skips re-hashing the whole schema.
+_FINGERPRINT_ENTRY = None
+
+def normalize_question(question):
+    """Normalize a question so trivially different phrasings share a cache entry."""
+    question = _WHITESPACE_RE.sub(' ', question.strip().lower())
+    return question.rstrip(_TRAILING_PUNCTUATION)
+
+def schema_fingerprint(schema):
+    """Return a stable digest of the schema dictionary."""
+    global _FINGERPRINT_ENTRY
+    entry = _FINGERPRINT_ENTRY
+    if entry is not None and entry[0] is schema:
+        return entry[1]
+    digest = hashlib.blake2b(repr(schema).encode('utf-8'), digest_size=16).digest()
+    _FINGERPRINT_ENTRY = (schema, digest)
+    return digest
+
+def question_key(question, schema, model=''):
+    """Build the cache key for a question asked of a model against a given schema."""
+    digest = hashlib.blake2b(normalize_question(question).encode('utf-8'), digest_size=16)
+    digest.update(schema_fingerprint(schema))
+    digest.update(model.encode('utf-8'))
+    return digest.hexdigest()
+
+def prompt_key(prompt, model=''):
+    """Build the cache key for a prompt sent to a model."""
+    digest = hashlib.blake2b(prompt.encode('utf-8'), digest_size=16)
+    digest.update(model.encode('utf-8'))
+    return digest.hexdigest()
+
+def _lookup(cache, key, ttl):
+    with _CACHE_LOCK:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= ttl:
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return entry[1]
+
+def _store(cache, key, value, maxsize):
+    with _CACHE_LOCK:
+        cache[key] = (time.monotonic(), value)
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+def _sql_store(config):
+    """Return (connection, lock) for the on-disk SQL cache, or None if disabled."""
+    path = config.get('query_cache_path')
+    if not path:
+        return None
+    store = _SQL_STORES.get(path)
+    if store is None:
+        with _SQL_STORES_LOCK:
+            store = _SQL_STORES.get(path)
+            if store is None:
+                conn = sqlite3.connect(path, check_same_thread=False)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sql_cache "
+                    "(key TEXT PRIMARY KEY, sql TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sql_cache_meta "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+                )
+                # Expired rows are never read again; drop them once per process
+                conn.execute("DELETE FROM sql_cache WHERE created < ?",
+                             (time.time() - config.get('query_cache_ttl', 300),))
+                conn.commit()
+                store = (conn, threading.Lock())
+                _SQL_STORES[path] = store
+    return store
+
+def get_cached_sql(config, key):
+    """Return previously generated SQL for a question key, or None."""
+    ttl = config.get('query_cache_ttl', 300)
+    if ttl <= 0:
+        return None
+    sql = _lookup(_SQL_CACHE, key, ttl)
+    if sql is None:
+        store = _sql_store(config)
+        if store is not None:
+            conn, lock = store
+            with lock:
+                row = conn.execute(
+                    "SELECT sql FROM sql_cache WHERE key = ? AND created >= ?",
+                    (key, time.time() - ttl)
+                ).fetchone()
+            if row:
+                sql = row[0]
+                _store(_SQL_CACHE, key, sql, config.get('query_cache_size', 256))
+    return sql
+
+def cache_sql(config, key, sql):
+    """Remember generated SQL for a question key."""
+    if config.get('query_cache_ttl', 300) > 0:
+        _store(_SQL_CACHE, key, sql, config.get('query_cache_size', 256))
+        store = _sql_store(config)
+        if store is not None:
+            conn, lock = store
+            with lock:
+                conn.execute("INSERT OR REPLACE INTO sql_cache VALUES (?, ?, ?)", (key, sql, time.time()))
+                conn.commit()
+
+def sync_sql_store(config, schema):
+    """Drop on-disk SQL that was generated against a different live schema.
+    
+    SQL keys fingerprint the schema prompt text, which can stay the same
+    when the database changes, so the store records the fingerprint of the
+    schema dictionary it was filled against and is emptied when that changes.
+    """
+    store = _sql_store(config)
+    if store is None:
+        return
+    fingerprint = schema_fingerprint(schema).hex()
+    conn, lock = store
+    with lock:
+        row = conn.execute("SELECT value FROM sql_cache_meta WHERE key = 'schema'").fetchone()
+        if row is None or row[0] != fingerprint:
+            conn.execute("DELETE FROM sql_cache")
+            conn.execute("INSERT OR REPLACE INTO sql_cache_meta VALUES ('schema', ?)", (fingerprint,))
+            conn.commit()
+
+def _result_key(config, sql):
+    return (config['db_host'], config['db_port'], config['db_name'], sql)
+
+def get_cached_result(config, sql):
+    """Return cached rows for an executed SQL string, or None."""
+    ttl = config.get('query_cache_ttl', 300)
+    if ttl <= 0:
+        return None
+    return _lookup(_RESULT_CACHE, _result_key(config, sql), ttl)
+
+def cache_result(config, sql, rows):
+    """Remember the rows returned by an executed SQL string."""
+    if config.get('query_cache_ttl', 300) > 0:
+        _store(_RESULT_CACHE, _result_key(config, sql), rows, config.get('query_cache_size', 256))
+
+def get_cached_response(config, key):
+    """Return a previously generated answer for a prompt key, or None."""
+    ttl = config.get('query_cache_ttl', 300)
+    if ttl <= 0:
+        return None
+    return _lookup(_RESPONSE_CACHE, key, ttl)
+
+def cache_response(config, key, text):
+    """Remember the answer generated for a prompt key."""
+    if config.get('query_cache_ttl', 300) > 0:
+        _store(_RESPONSE_CACHE, key, text, config.get('query_cache_size', 256))
+
+def clear_cache():
+    """Drop all in-memory cached SQL, query results and answers.
+    
+    The on-disk SQL cache is left alone; sync_sql_store empties it once a
+    fetched schema differs from the one its entries were generated for.
+    """
+    global _FINGERPRINT_ENTRY
+    _FINGERPRINT_ENTRY = None
+    with _CACHE_LOCK:
+        _SQL_CACHE.clear()
+        _RESULT_CACHE.clear()
+        _RESPONSE_CACHE.clear()
@@ -1,27 +1,47 @@
 import os
+from functools import lru_cache
+from types import MappingProxyType
 from dotenv import load_dotenv
 
+@lru_cache(maxsize=1)
 def load_config():
-    """Load configuration from environment variables."""
+    """Load configuration from environment variables.
+    
+    The result is cached for the lifetime of the process and returned as a
+    read-only mapping; call load_config.cache_clear() to re-read .env.
+    """
     load_dotenv()
     
     config = {
         'openrouter_api_key': os.getenv('OPENROUTER_API_KEY'),
+        'openrouter_api_keys': tuple(key.strip() for key in os.getenv('OPENROUTER_API_KEYS', '').split(',') if key.strip()),
         'db_host': os.getenv('DB_HOST', 'localhost'),
         'db_port': int(os.getenv('DB_PORT', 5432)),
         'db_name': os.getenv('DB_NAME', 'sql_agent'),
         'db_user': os.getenv('DB_USER'),
         'db_password': os.getenv('DB_PASSWORD'),
+        'db_pool_size': int(os.getenv('DB_POOL_SIZE', 8)),
         'debug': os.getenv('DEBUG', 'false').lower() == 'true',
+        'schema_cache_ttl': int(os.getenv('SCHEMA_CACHE_TTL', 900)),
+        # Cached query results are served as-is until they expire, so answers
+        # may lag live data by up to this many seconds; 0 disables caching
+        'query_cache_ttl': int(os.getenv('QUERY_CACHE_TTL', 300)),
+        'query_cache_size': int(os.getenv('QUERY_CACHE_SIZE', 256)),
+        'query_cache_path': os.getenv('QUERY_CACHE_PATH', ''),
         
         # LLM Configuration
         'llm_model': os.getenv('LLM_MODEL', 'anthropic/claude-3.5-sonnet'),
         'llm_timeout': int(os.getenv('LLM_TIMEOUT', 30)),
+        'llm_max_concurrency': int(os.getenv('LLM_MAX_CONCURRENCY', 4)),
+        'llm_rpm': int(os.getenv('LLM_RPM', 0)),
+        'llm_stream': os.getenv('LLM_STREAM', 'true').lower() == 'true',
+        'llm_structured_output': os.getenv('LLM_STRUCTURED_OUTPUT', 'false').lower() == 'true',
         'response_language': os.getenv('RESPONSE_LANGUAGE', 'auto'),
+        'llm_max_prompt_tokens': int(os.getenv('LLM_MAX_PROMPT_TOKENS', 4000)),
         'max_response_length': int(os.getenv('MAX_RESPONSE_LENGTH', 2000))
     }
     
-    return config
+    return MappingProxyType(config)
 
 def validate_config(config):
     """Validate that required configuration is present."""
@@ -31,4 +51,21 @@ def validate_config(config):
     if missing:
         raise ValueError(f"Missing required configuration: {', '.join(missing)}")
     
-    return True
\ No newline at end of file
+    return True
+
+# The config object that last passed validation; load_config hands out the
+# same object until its cache is cleared, so it only needs checking once
+_VALIDATED_CONFIG = None
+
+def load_validated_config():
+    """Load the configuration and validate it once per loaded config.
+    
+    Raises ValueError like validate_config. Failures are not remembered, and
+    load_config.cache_clear() makes the next call re-read and re-check .env.
+    """
+    global _VALIDATED_CONFIG
+    config = load_config()
+    if config is not _VALIDATED_CONFIG:
+        validate_config(config)
+        _VALIDATED_CONFIG = config
+    return config
@@ -1,65 +1,180 @@
-import psycopg2
-import psycopg2.extras
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from cache import get_cached_result, cache_result, clear_cache, sync_sql_store, schema_fingerprint
+from utils import TransientError
+
+# psycopg2 is imported on first database access so config-only entry points
+# (validation, help, vacation lookups) don't pay for loading the driver
+_PSYCOPG2 = None
+
+def _psycopg():
+    """Import psycopg2 and register the NUMERIC caster on first use."""
+    global _PSYCOPG2
+    if _PSYCOPG2 is None:
+        import psycopg2
+        import psycopg2.errors
+        import psycopg2.extras
+        import psycopg2.pool
+        # Return NUMERIC columns as float straight from the driver so results
+        # are JSON-serializable without a per-row conversion pass
+        dec2float = psycopg2.extensions.new_type(
+            psycopg2.extensions.DECIMAL.values,
+            'DEC2FLOAT',
+            lambda value, cursor: float(value) if value is not None else None
+        )
+        psycopg2.extensions.register_type(dec2float)
+        _PSYCOPG2 = psycopg2
+    return _PSYCOPG2
+
+# Dangerous DDL/DML keywords at statement boundaries
+_DANGEROUS_PATTERN = (
+    r'\b(?:DROP\s+(?:TABLE|DATABASE|SCHEMA)|DELETE\s+FROM|INSERT\s+INTO|UPDATE\s+\w+\s+SET'
+    r'|TRUNCATE\s+TABLE|ALTER\s+TABLE|CREATE\s+(?:TABLE|DATABASE|SCHEMA))\b'
+)
+
+# Basic SQL injection patterns
+_INJECTION_PATTERNS = (';--', '/*', '*/', 'OR 1=1', 'OR 1 = 1')
+
+# Both blocklists compiled into a single case-insensitive pattern at import,
+# so a query is scanned in one pass
+_UNSAFE_SQL_RE = re.compile(
+    '|'.join((_DANGEROUS_PATTERN,) + tuple(map(re.escape, _INJECTION_PATTERNS))),
+    re.IGNORECASE
+)
+
+# Tokens that matter when finding where a statement ends: line comments,
+# quoted literals and identifiers (which may contain '--' or ';'), and
+# everything else one run or character at a time
+_SQL_TOKEN_RE = re.compile(r"--[^\n]*|'[^']*'|\"[^\"]*\"|[^\s;'\"-]+|\S")
+
+# How far back from the end of the statement to look for an existing LIMIT
+_LIMIT_SEARCH_WINDOW = 200
+
+# An outer LIMIT n|ALL [OFFSET m] clause ends the statement; matching only at
+# the end avoids false positives from column names like rate_limit or
+# 'NO LIMIT' literals
+_LIMIT_RE = re.compile(r'\bLIMIT\s+(?:\d+|ALL)(?:\s+OFFSET\s+\d+)?$', re.IGNORECASE)
+
+# How much of the start of a query to uppercase for keyword detection
+_HEAD_WINDOW = 64
+
+# Schema introspection query, run as a prepared statement
+SCHEMA_QUERY = """
+    SELECT 
+        table_name,
+        column_name,
+        data_type,
+        is_nullable
+    FROM information_schema.columns 
+    WHERE table_schema = 'public'
+    ORDER BY table_name, ordinal_position
+"""
+_SCHEMA_STATEMENT = 'sql_agent_schema'
+
+# Schema cache: (db_host, db_port, db_name) -> (fetched_at, tables)
+_SCHEMA_CACHE = {}
+
+# Serializes schema fetches so concurrent misses (e.g. a prewarm racing the
+# first question) share one introspection query
+_SCHEMA_LOCK = threading.Lock()
+
+# Last (schema, prompt text) pair; get_schema hands out the same dict until
+# it is reloaded, so the formatted text is reused while that holds
+_SCHEMA_PROMPT_ENTRY = None
+
+# (pool, slots) keyed by connection parameters, created lazily. getconn
+# raises instead of waiting when the pool is exhausted, so borrowers take
+# one of the semaphore's slots first and wait there for a free connection.
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+@dataclass(slots=True)
+class SqlInfo:
+    """SQL text plus the metadata the safety and LIMIT checks need, computed once."""
+    text: str
+    upper_head: str
+    is_select: bool
+    has_limit: bool
+    body_end: int
+
+def _statement_end(text):
+    """Return the index just past the statement, before trailing comments and ';'."""
+    if '--' not in text:
+        return len(text.rstrip().rstrip(';').rstrip())
+    end = 0
+    for match in _SQL_TOKEN_RE.finditer(text):
+        token = match.group()
+        if token != ';' and not token.startswith('--'):
+            end = match.end()
+    return end
+
+def classify_sql(sql):
+    """Strip and classify a SQL string, uppercasing only its head."""
+    text = sql.strip()
+    upper_head = text[:_HEAD_WINDOW].upper()
+    body_end = _statement_end(text)
+    return SqlInfo(
+        text=text,
+        upper_head=upper_head,
+        is_select=upper_head.startswith(('SELECT', 'WITH')),
+        # An outer LIMIT clause sits at the end of the statement
+        has_limit=_LIMIT_RE.search(text, max(0, body_end - _LIMIT_SEARCH_WINDOW), body_end) is not None,
+        body_end=body_end
+    )
 
 def is_safe_sql(sql):
-    """Check if SQL query is safe to execute."""
+    """Check if SQL query is safe to execute. Accepts a string or SqlInfo."""
     if not sql:
         return False
         
-    # Clean and normalize SQL for checking
-    sql_upper = sql.strip().upper()
+    info = sql if isinstance(sql, SqlInfo) else classify_sql(sql)
     
     # Must start with SELECT (only read operations allowed)
-    if not sql_upper.startswith('SELECT') and not sql_upper.startswith('WITH'):
+    if not info.is_select:
         return False
     
-    # Block dangerous DDL/DML keywords at statement boundaries
-    dangerous_patterns = [
-        r'\bDROP\s+TABLE\b', r'\bDROP\s+DATABASE\b', r'\bDROP\s+SCHEMA\b',
-        r'\bDELETE\s+FROM\b', r'\bINSERT\s+INTO\b', r'\bUPDATE\s+\w+\s+SET\b',
-        r'\bTRUNCATE\s+TABLE\b', r'\bALTER\s+TABLE\b', r'\bCREATE\s+TABLE\b',
-        r'\bCREATE\s+DATABASE\b', r'\bCREATE\s+SCHEMA\b'
-    ]
-    
-    import re
-    for pattern in dangerous_patterns:
-        if re.search(pattern, sql_upper):
-            return False
-    
-    # Basic SQL injection patterns
-    injection_patterns = [';--', '/*', '*/', 'OR 1=1', 'OR 1 = 1']
-    for pattern in injection_patterns:
-        if pattern.upper() in sql_upper:
-            return False
+    # Block dangerous DDL/DML keywords and basic injection patterns
+    if _UNSAFE_SQL_RE.search(info.text):
+        return False
     
     return True
 
 def add_limit_if_needed(sql):
-    """Add LIMIT clause to SELECT queries if not present."""
+    """Add LIMIT clause to SELECT queries if not present. Accepts a string or SqlInfo."""
     if not sql:
         return sql
         
-    sql_stripped = sql.strip()
-    sql_upper = sql_stripped.upper()
+    info = sql if isinstance(sql, SqlInfo) else classify_sql(sql)
+    unchanged = info.text if isinstance(sql, SqlInfo) else sql
+    sql_stripped = info.text
     
     # Only modify SELECT statements
-    if not sql_upper.startswith('SELECT'):
-        return sql
+    if not info.upper_head.startswith('SELECT'):
+        return unchanged
         
     # Check if LIMIT already exists
-    if 'LIMIT' in sql_upper:
-        return sql
+    if info.has_limit:
+        return unchanged
         
-    # Remove trailing semicolon if present, add LIMIT, then add semicolon back
-    if sql_stripped.endswith(';'):
-        return sql_stripped[:-1] + ' LIMIT 1000;'
-    else:
-        return sql_stripped + ' LIMIT 1000'
+    # Insert before any trailing ';' and comments so neither can cut it off
+    return sql_stripped[:info.body_end] + ' LIMIT 1000' + sql_stripped[info.body_end:]
+
+def _connection_errors():
+    """Driver errors that mean the connection failed, not the query."""
+    if _PSYCOPG2 is None:
+        # The driver never loaded, so none of its errors can have been raised
+        return ()
+    return (_PSYCOPG2.OperationalError, _PSYCOPG2.InterfaceError)
 
 def connect_db(config):
     """Connect to PostgreSQL database."""
     try:
-        conn = psycopg2.connect(
+        conn = _psycopg().connect(
             host=config['db_host'],
             port=config['db_port'],
             database=config['db_name'],
@@ -71,57 +186,128 @@ def connect_db(config):
         print(f"Database connection error: {e}")
         return None
 
-def execute_query(config, sql):
-    """Execute SQL query and return results."""
+def _pool_entry(config):
+    """Return (pool, slots) for this database, creating them on first use."""
+    key = (config['db_host'], config['db_port'], config['db_name'], config['db_user'])
+    entry = _POOLS.get(key)
+    if entry is None:
+        with _POOLS_LOCK:
+            entry = _POOLS.get(key)
+            if entry is None:
+                size = config.get('db_pool_size', 8)
+                pool = _psycopg().pool.ThreadedConnectionPool(
+                    1,
+                    size,
+                    host=config['db_host'],
+                    port=config['db_port'],
+                    database=config['db_name'],
+                    user=config['db_user'],
+                    password=config['db_password']
+                )
+                entry = (pool, threading.BoundedSemaphore(size))
+                _POOLS[key] = entry
+    return entry
+
+@contextmanager
+def pooled_connection(config):
+    """Borrow a connection from the pool and return it when done.
+    
+    Waits for a free connection when all of them are borrowed.
+    """
+    pool, slots = _pool_entry(config)
+    slots.acquire()
+    try:
+        conn = pool.getconn()
+        try:
+            # Only read-only queries run here, so skip the implicit transaction
+            # and the rollback round trip the pool would issue on return
+            if not conn.autocommit:
+                conn.autocommit = True
+            yield conn
+        finally:
+            # Discard connections that broke while borrowed
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        slots.release()
+
+def execute_query(config, sql, max_rows=None):
+    """Execute SQL query and return results.
+    
+    With max_rows, a SELECT reads through a server-side cursor and returns
+    at most that many rows, so large results never reach the client.
+    Raises TransientError when the connection failed rather than the query.
+    """
     if not sql:
         print("Error: Empty SQL query")
         return None
         
+    # Strip and classify once, then reuse for every check below
+    info = classify_sql(sql)
+    
     # Safety check
-    if not is_safe_sql(sql):
+    if not is_safe_sql(info):
         print(f"Warning: Unsafe SQL query blocked: {sql}")
         return {"error": "Unsafe SQL query blocked"}
         
     # Add LIMIT for SELECT queries if needed
-    sql = add_limit_if_needed(sql)
+    sql = add_limit_if_needed(info)
+    
+    cached = get_cached_result(config, sql)
+    if cached is not None:
+        return cached[:max_rows] if max_rows else cached
     
-    conn = None
     try:
-        conn = connect_db(config)
-        if not conn:
-            return None
+        with pooled_connection(config) as conn:
+            if max_rows and info.is_select:
+                # Named cursors need a transaction; the pool rolls it back on return
+                conn.autocommit = False
+                cursor = conn.cursor(
+                    name=f"preview_{uuid.uuid4().hex}",
+                    cursor_factory=_psycopg().extras.RealDictCursor
+                )
+                try:
+                    cursor.execute(sql)
+                    results = cursor.fetchmany(max_rows)
+                finally:
+                    cursor.close()
+                # A short read is the whole result and safe to share with full queries
+                if len(results) < max_rows:
+                    cache_result(config, sql, results)
+                return results
             
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute(sql)
-        
-        # Check if this is a SELECT query (including WITH clauses that end with SELECT)
-        sql_upper = sql.strip().upper()
-        if sql_upper.startswith('SELECT') or (sql_upper.startswith('WITH') and 'SELECT' in sql_upper):
-            results = cursor.fetchall()
-            # Convert Decimal objects to float for JSON serialization
-            import decimal
-            converted_results = []
-            for row in results:
-                converted_row = {}
-                for key, value in dict(row).items():
-                    if isinstance(value, decimal.Decimal):
-                        converted_row[key] = float(value)
-                    else:
-                        converted_row[key] = value
-                converted_results.append(converted_row)
-            return converted_results
-        else:
-            conn.commit()
-            return {"status": "success"}
+            cursor = conn.cursor(cursor_factory=_psycopg().extras.RealDictCursor)
+            cursor.execute(sql)
             
+            # Check if this is a SELECT query (including WITH clauses)
+            if info.is_select:
+                results = cursor.fetchall()
+                cache_result(config, sql, results)
+                return results
+            else:
+                conn.commit()
+                return {"status": "success"}
+            
+    except _connection_errors() as e:
+        print(f"Query execution error: {e}")
+        # A statement timeout would only time out again
+        if isinstance(e, _PSYCOPG2.extensions.QueryCanceledError):
+            return None
+        raise TransientError(str(e)) from e
     except Exception as e:
         print(f"Query execution error: {e}")
-        if conn:
-            conn.rollback()
         return None
-    finally:
-        if conn:
-            conn.close()
+
+def execute_queries(config, sqls):
+    """Execute several independent SQL queries concurrently over the connection pool.
+    
+    Returns results in the same order as sqls, each as execute_query would.
+    """
+    if not sqls:
+        return []
+    
+    workers = min(len(sqls), config.get('db_pool_size', 8))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda sql: execute_query(config, sql), sqls))
 
 def setup_database_from_file(config, sql_file_path):
     """Set up database from SQL file."""
@@ -144,19 +330,14 @@ def setup_database_from_file(config, sql_file_path):
                 
             cursor = conn.cursor()
             
-            # Split SQL content by statements (simple approach)
-            statements = [stmt.strip() for stmt in sql_content.split(';') if stmt.strip()]
+            # Send the whole file as one multi-statement buffer inside a single
+            # transaction: one round trip, and no naive splitting on ';' that
+            # breaks string literals and dollar-quoted function bodies
+            cursor.execute(sql_content)
             
-            for i, statement in enumerate(statements):
-                try:
-                    print(f"Executing statement {i+1}/{len(statements)}")
-                    cursor.execute(statement)
-                except Exception as e:
-                    print(f"Error in statement {i+1}: {e}")
-                    continue
-                    
             conn.commit()
-            print("✓ Database setup completed successfully")
+            invalidate_schema(config)
+            print(f"✓ Database setup completed successfully ({len(sql_content)} bytes of SQL executed)")
             return True
             
         except Exception as e:
@@ -175,21 +356,67 @@ def setup_database_from_file(config, sql_file_path):
         print(f"File reading error: {e}")
         return False
 
+def _execute_prepared(conn, name, sql):
+    """Run a static query as a server-side prepared statement on this connection.
+    
+    The statement is prepared on first use per connection, so pooled
+    connections skip parse and plan on later calls.
+    """
+    cursor = conn.cursor(cursor_factory=_psycopg().extras.RealDictCursor)
+    try:
+        cursor.execute(f"EXECUTE {name}")
+    except _psycopg().errors.InvalidSqlStatementName:
+        cursor.execute(f"PREPARE {name} AS {sql}")
+        cursor.execute(f"EXECUTE {name}")
+    return cursor.fetchall()
+
+def _schema_cache_key(config):
+    return (config['db_host'], config['db_port'], config['db_name'])
+
+def invalidate_schema(config=None):
+    """Drop cached schema for one database, or for all databases if no config given."""
+    if config is None:
+        _SCHEMA_CACHE.clear()
+    else:
+        _SCHEMA_CACHE.pop(_schema_cache_key(config), None)
+    clear_cache()
+
 def get_schema(config):
-    """Get database schema information."""
-    schema_query = """
-    SELECT 
-        table_name,
-        column_name,
-        data_type,
-        is_nullable
-    FROM information_schema.columns 
-    WHERE table_schema = 'public'
-    ORDER BY table_name, ordinal_position;
+    """Get database schema information.
+    
+    Results are cached per database for config['schema_cache_ttl'] seconds.
+    Returns None on failure, or raises TransientError when the database
+    could not be reached.
     """
+    key = _schema_cache_key(config)
+    ttl = config.get('schema_cache_ttl', 900)
+    cached = _SCHEMA_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
     
+    with _SCHEMA_LOCK:
+        cached = _SCHEMA_CACHE.get(key)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        return _fetch_schema(config, key)
+
+def get_schema_prompt(config):
+    """Return the cached schema formatted for LLM prompts, or None if unavailable."""
+    global _SCHEMA_PROMPT_ENTRY
+    schema = get_schema(config)
+    if not schema:
+        return None
+    entry = _SCHEMA_PROMPT_ENTRY
+    if entry is not None and entry[0] is schema:
+        return entry[1]
+    text = format_schema_for_llm(schema)
+    _SCHEMA_PROMPT_ENTRY = (schema, text)
+    return text
+
+def _fetch_schema(config, key):
     try:
-        results = execute_query(config, schema_query)
+        with pooled_connection(config) as conn:
+            results = _execute_prepared(conn, _SCHEMA_STATEMENT, SCHEMA_QUERY)
         if not results:
             return None
             
@@ -203,19 +430,68 @@ def get_schema(config):
                 'type': row['data_type'],
                 'nullable': row['is_nullable']
             })
+        previous = _SCHEMA_CACHE.get(key)
+        if previous is not None:
+            if schema_fingerprint(previous[1]) == schema_fingerprint(tables):
+                # Unchanged: keep handing out the same dict so the prompt
+                # text and fingerprint cached against it stay valid
+                tables = previous[1]
+            else:
+                # A changed schema makes cached SQL and results stale
+                clear_cache()
+        sync_sql_store(config, tables)
+        _SCHEMA_CACHE[key] = (time.monotonic(), tables)
         return tables
         
+    except _connection_errors() as e:
+        print(f"Schema retrieval error: {e}")
+        raise TransientError(str(e)) from e
     except Exception as e:
         print(f"Schema retrieval error: {e}")
         return None
 
-def format_schema_for_llm(schema):
-    """Format database schema for LLM context with business context and examples."""
-    if not schema:
-        return "No schema available"
-        
-    # Enhanced schema with business context and sample data
-    enhanced_schema = """
+# Catalog-only count of what SCHEMA_QUERY would list (tables, views,
+# materialized views, partitioned and foreign tables)
+TABLE_COUNT_QUERY = """
+    SELECT count(*) AS tables
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'v', 'm', 'p', 'f')
+"""
+_TABLE_COUNT_STATEMENT = 'sql_agent_table_count'
+
+def get_table_count(config):
+    """Return the number of tables in the database, or None on error.
+    
+    Uses the cached schema when it is still fresh; otherwise counts catalog
+    entries instead of running the full schema introspection.
+    """
+    cached = _SCHEMA_CACHE.get(_schema_cache_key(config))
+    if cached and time.monotonic() - cached[0] < config.get('schema_cache_ttl', 900):
+        return len(cached[1])
+    try:
+        with pooled_connection(config) as conn:
+            return _execute_prepared(conn, _TABLE_COUNT_STATEMENT, TABLE_COUNT_QUERY)[0]['tables']
+    except Exception as e:
+        print(f"Table count error: {e}")
+        return None
+
+def _prewarm(config):
+    try:
+        get_schema(config)
+    except TransientError:
+        # Already reported; the first question fetches the schema again
+        pass
+
+def prewarm_schema(config):
+    """Fetch the schema in the background so the first question finds it cached."""
+    thread = threading.Thread(target=_prewarm, args=(config,), name='schema-prewarm', daemon=True)
+    thread.start()
+    return thread
+
+# Enhanced schema with business context and sample data. The text is static,
+# so it is built once at import instead of on every prompt.
+_ENHANCED_SCHEMA = """
 DATABASE SCHEMA with Business Context and Examples:
 
 Table: team
@@ -282,29 +558,33 @@ IMPORTANT NOTES:
 - Team names: Alpha, Fusion, DL, Finance, HR & Recruiting, International, Marketing, Oyster, Pink Goose, Presales, Zoo, Sales, Reactor
 - To find team activity, join project → task → task_employee → employee → team
 - To find vacation info, check vacation_left field or use vacation system
-"""
-    
-    return enhanced_schema.strip()
+""".strip()
+
+def format_schema_for_llm(schema):
+    """Format database schema for LLM context with business context and examples."""
+    if not schema:
+        return "No schema available"
+        
+    return _ENHANCED_SCHEMA
 
 def test_connection(config):
-    """Test database connection."""
+    """Test database connection.
+    
+    The check borrows from the shared pool, so a successful test leaves a
+    live connection behind for the queries that follow.
+    """
     try:
         print("Attempting database connection...")
-        conn = connect_db(config)
-        if conn:
+        with pooled_connection(config) as conn:
             print("Connection established, testing query execution...")
             cursor = conn.cursor()
             cursor.execute("SELECT 1")
             result = cursor.fetchone()
-            conn.close()
-            if result is not None:
-                print("✓ Database connection test successful")
-                return True
-            else:
-                print("✗ Database query test failed")
-                return False
+        if result is not None:
+            print("✓ Database connection test successful")
+            return True
         else:
-            print("✗ Database connection failed")
+            print("✗ Database query test failed")
             return False
     except Exception as e:
         print(f"✗ Connection test error: {e}")
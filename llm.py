@@ -1,5 +1,225 @@
-import requests
+import asyncio
+import itertools
 import json
+import random
+import re
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import lru_cache
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from cache import question_key, prompt_key, get_cached_sql, cache_sql, get_cached_response, cache_response
+from utils import TransientError
+
+OPENROUTER_URL = 'https://openrouter.ai/api/v1/chat/completions'
+OPENROUTER_BASE_URL = 'https://openrouter.ai/api/v1/'
+
+# Parses bytes or str; orjson is optional and several times faster
+_loads = orjson.loads if orjson is not None else json.loads
+
+# JSON schema for structured SQL output, so the query comes back already extracted
+_SQL_RESPONSE_FORMAT = {
+    'type': 'json_schema',
+    'json_schema': {
+        'name': 'sql_out',
+        'schema': {
+            'type': 'object',
+            'properties': {'sql': {'type': 'string'}},
+            'required': ['sql']
+        }
+    }
+}
+
+# First fenced code block in an LLM response; the whole info string after the
+# opening fence (sql, postgresql, pgsql, ...) is skipped
+_CODE_BLOCK_RE = re.compile(r'```[^\n`]*\n(.*?)```', re.DOTALL)
+
+# Whole lines that are blank or start a markdown fence
+_NOISE_LINE_RE = re.compile(r'^[ \t]*(?:```[^\n]*)?(?:\n|$)', re.MULTILINE)
+
+# Labels models put in front of the query, e.g. "SQL Query:"
+_SQL_PREFIX_RE = re.compile(r'(?:(?:SQL\s*Query|Query|SQL)\s*:\s*)+', re.IGNORECASE)
+
+# Labels models put in front of an answer, including the Ukrainian one
+_ANSWER_PREFIX_RE = re.compile(r'(?:(?:Answer|Response|Відповідь)\s*:\s*)+', re.IGNORECASE)
+
+# requests is imported and the shared session built on the first API call,
+# so importing this module stays cheap for paths that never reach OpenRouter
+_REQUESTS = None
+_SESSION = None
+
+def _requests():
+    """Import requests on first use."""
+    global _REQUESTS
+    if _REQUESTS is None:
+        import requests
+        _REQUESTS = requests
+    return _REQUESTS
+
+# Keep-alive sockets kept per host. requests speaks HTTP/1.1 only (HTTP/2
+# multiplexing would need httpx with h2, which this project doesn't use), so
+# each in-flight call needs its own socket; the pool is never smaller than the
+# largest concurrency requested so far, or extra sockets would be closed after use.
+_MIN_POOL_SIZE = 32
+
+# Size of the pool currently mounted on _SESSION
+_SESSION_POOL_SIZE = 0
+_SESSION_LOCK = threading.Lock()
+
+def _adapter(pool_size):
+    """Build the HTTPS adapter for the shared session."""
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    return HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=pool_size,
+        # The completion POST is billed and not idempotent, so only failures
+        # that mean the model never ran are retried: connection errors, 429
+        # (rejected by the rate limiter) and 503 (no capacity). Read timeouts,
+        # 500, 502 and 504 can arrive after the model already ran.
+        max_retries=Retry(
+            total=2,
+            read=0,
+            backoff_factor=0.3,
+            status_forcelist=[429, 503],
+            allowed_methods=None,
+            raise_on_status=False
+        )
+    )
+
+def _session(pool_size=_MIN_POOL_SIZE):
+    """Return the shared HTTP session, creating it on first use.
+    
+    OpenRouter calls reuse pooled keep-alive connections instead of paying a
+    TCP+TLS handshake per request. Asking for a larger pool_size than the
+    session has remounts a bigger pool, whichever caller came first.
+    Connection errors, 429 and 503 responses are retried with backoff (see
+    _adapter); the final response is still returned so call_openrouter can
+    report it.
+    """
+    global _SESSION, _SESSION_POOL_SIZE
+    pool_size = max(_MIN_POOL_SIZE, pool_size)
+    if _SESSION is None or pool_size > _SESSION_POOL_SIZE:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                session = _requests().Session()
+                session.headers.update({
+                    'Content-Type': 'application/json',
+                    'HTTP-Referer': 'http://localhost',
+                    'X-Title': 'SQL Agent'
+                })
+                session.mount('https://', _adapter(pool_size))
+                _SESSION_POOL_SIZE = pool_size
+                _SESSION = session
+            elif pool_size > _SESSION_POOL_SIZE:
+                # Connections in flight on the old pool finish normally
+                _SESSION.mount('https://', _adapter(pool_size))
+                _SESSION_POOL_SIZE = pool_size
+    return _SESSION
+
+def _warm_connection(session, timeout):
+    try:
+        session.head(OPENROUTER_BASE_URL, timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+def prewarm_openrouter(config, n=None):
+    """Open keep-alive connections to OpenRouter in the background.
+    
+    Defaults to one connection per allowed concurrent call, so the first
+    API calls skip the TCP+TLS handshake. Returns the background thread so
+    callers may join it if they need to.
+    """
+    n = n or config.get('llm_max_concurrency', 4)
+    session = _session(n)
+    timeout = min(config.get('llm_timeout', 30), 5)
+    
+    def warm():
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            warmed = sum(executor.map(lambda _: _warm_connection(session, timeout), range(n)))
+        if config.get('debug'):
+            print(f"Prewarmed {warmed}/{n} OpenRouter connections")
+    
+    thread = threading.Thread(target=warm, name='openrouter-prewarm', daemon=True)
+    thread.start()
+    return thread
+
+# Few-shot query patterns; only those sharing terms with the question are
+# included in the prompt. Each entry is (matching terms, prompt text).
+_SQL_EXAMPLES = (
+    ('most active project hours logged time spent week activity найактивніший проект години активність тиждень', """For team activity/project hours (активність команди):
+```sql
+-- Most active project by hours in team (recent week)
+SELECT 
+  p.name as project_name,
+  SUM(t.time_spent) / 3600000000.0 as total_hours
+FROM project p
+JOIN task t ON t.clickup_id = p.clickup_id
+JOIN task_employee te ON t.task_id = te.task_id
+JOIN employee e ON te.employee_id = e.employee_id
+JOIN team tm ON e.team_id = tm.team_id
+WHERE tm.name = 'Fusion' 
+  AND t.date_updated >= '2025-11-14' 
+  AND t.date_updated <= '2025-11-21'
+  AND t.time_spent IS NOT NULL
+GROUP BY p.project_id, p.name
+ORDER BY total_hours DESC
+LIMIT 1;
+```"""),
+    ('composition developer specialization role склад композиція розробник розробники спеціалізація', """For team composition by specialization (композиція команди):
+```sql
+-- Team composition with developer specializations
+SELECT 
+  t.name as team_name,
+  COALESCE(d.specialization, 'Unknown') as specialization,
+  COUNT(DISTINCT e.employee_id) as developer_count
+FROM team t
+JOIN employee e ON t.team_id = e.team_id
+LEFT JOIN developer d ON e.clickup_id = d.clickup_id
+GROUP BY t.name, COALESCE(d.specialization, 'Unknown')
+ORDER BY t.name, developer_count DESC;
+```"""),
+    ('vacation days off holiday leave відпустка відпуск відпустці днів відгул', """For vacation queries (відпуск):
+```sql
+-- Alpha team vacation days since New Year
+SELECT 
+  e.name as employee_name,
+  e.employee_id,
+  'Use vacation.py data integration' as vacation_note
+FROM employee e
+JOIN team t ON e.team_id = t.team_id
+WHERE t.name = 'Alpha';
+```"""),
+)
+
+# Most examples included in one prompt
+_SQL_EXAMPLE_LIMIT = 2
+
+_WORD_RE = re.compile(r'\w{3,}')
+
+def _term_stems(text):
+    """Lowercased word prefixes, so inflected forms (відпустки/відпуск) still match."""
+    return frozenset(word[:5] for word in _WORD_RE.findall(text.lower()))
+
+_SQL_EXAMPLE_INDEX = tuple((_term_stems(terms), text) for terms, text in _SQL_EXAMPLES)
+
+def select_sql_examples(question, limit=_SQL_EXAMPLE_LIMIT):
+    """Render the query patterns most relevant to question, or '' if none match."""
+    stems = _term_stems(question)
+    scored = sorted(
+        ((len(stems & example_stems), i) for i, (example_stems, _) in enumerate(_SQL_EXAMPLE_INDEX)),
+        key=lambda item: -item[0]
+    )
+    chosen = sorted(i for score, i in scored[:limit] if score)
+    if not chosen:
+        return ''
+    return 'QUERY PATTERNS:\n\n' + '\n\n'.join(_SQL_EXAMPLE_INDEX[i][1] for i in chosen) + '\n\n'
 
 # Enhanced prompt templates with Ukrainian support
 SQL_GENERATION_TEMPLATE = """Given this PostgreSQL database schema:
@@ -56,55 +276,7 @@ SCHEMA RELATIONSHIPS:
 - task_employee links tasks to employees
 - project_employee links projects to employees
 
-QUERY PATTERNS:
-
-For team activity/project hours (активність команди):
-```sql
--- Most active project by hours in team (recent week)
-SELECT 
-  p.name as project_name,
-  SUM(t.time_spent) / 3600000000.0 as total_hours
-FROM project p
-JOIN task t ON t.clickup_id = p.clickup_id
-JOIN task_employee te ON t.task_id = te.task_id
-JOIN employee e ON te.employee_id = e.employee_id
-JOIN team tm ON e.team_id = tm.team_id
-WHERE tm.name = 'Fusion' 
-  AND t.date_updated >= '2025-11-14' 
-  AND t.date_updated <= '2025-11-21'
-  AND t.time_spent IS NOT NULL
-GROUP BY p.project_id, p.name
-ORDER BY total_hours DESC
-LIMIT 1;
-```
-
-For team composition by specialization (композиція команди):
-```sql
--- Team composition with developer specializations
-SELECT 
-  t.name as team_name,
-  COALESCE(d.specialization, 'Unknown') as specialization,
-  COUNT(DISTINCT e.employee_id) as developer_count
-FROM team t
-JOIN employee e ON t.team_id = e.team_id
-LEFT JOIN developer d ON e.clickup_id = d.clickup_id
-GROUP BY t.name, COALESCE(d.specialization, 'Unknown')
-ORDER BY t.name, developer_count DESC;
-```
-
-For vacation queries (відпуск):
-```sql
--- Alpha team vacation days since New Year
-SELECT 
-  e.name as employee_name,
-  e.employee_id,
-  'Use vacation.py data integration' as vacation_note
-FROM employee e
-JOIN team t ON e.team_id = t.team_id
-WHERE t.name = 'Alpha';
-```
-
-IMPORTANT:
+{examples}IMPORTANT:
 - Always convert microseconds to hours using "/ 3600000000.0"
 - Use LEFT JOINs when data might be missing
 - Handle NULL values with COALESCE
@@ -140,238 +312,751 @@ Return only the corrected SQL query, no explanation.
 
 Corrected SQL:"""
 
-def call_openrouter(config, messages):
-    """Make API call to OpenRouter."""
+def _compile_template(template):
+    """Split a str.format template once into (literal, field_name) chunks."""
+    return tuple((literal, field) for literal, field, _, _ in string.Formatter().parse(template))
+
+def _render(chunks, values):
+    """Render a compiled template by plain concatenation, skipping format parsing."""
+    out = []
+    for literal, field in chunks:
+        out.append(literal)
+        if field is not None:
+            out.append(values[field])
+    return ''.join(out)
+
+def _bind(chunks, values):
+    """Fill some fields of a compiled template now, merging adjacent literals."""
+    bound = []
+    literal = ''
+    for text, field in chunks:
+        literal += text
+        if field is None:
+            continue
+        if field in values:
+            literal += values[field]
+        else:
+            bound.append((literal, field))
+            literal = ''
+    bound.append((literal, None))
+    return tuple(bound)
+
+def _schema_text(schema):
+    """Schema as prompt text; already-formatted strings pass through unchanged."""
+    if isinstance(schema, str):
+        return schema
+    from database import format_schema_for_llm
+    return format_schema_for_llm(schema)
+
+@lru_cache(maxsize=8)
+def _bind_schema(chunks, schema_text):
+    """Compiled template with the schema pre-rendered into its head.
+    
+    The formatted schema rarely changes, so the ~4 KB of schema text and
+    surrounding instructions become a single literal reused across calls.
+    """
+    return _bind(chunks, {'schema': schema_text})
+
+_SQL_GENERATION_CHUNKS = _compile_template(SQL_GENERATION_TEMPLATE)
+_RESPONSE_GENERATION_CHUNKS = _compile_template(RESPONSE_GENERATION_TEMPLATE)
+_SQL_ERROR_CORRECTION_CHUNKS = _compile_template(SQL_ERROR_CORRECTION_TEMPLATE)
+
+# Same prompt, asking for one delimited query per numbered question
+SQL_BATCH_GENERATION_TEMPLATE = SQL_GENERATION_TEMPLATE.replace(
+    'Generate a SQL query to answer this question: {question}',
+    'Generate one SQL query for each of these numbered questions:\n{questions}'
+).replace(
+    '- Return only the SQL query, no explanation\n\nSQL Query:',
+    '- For each question N, write a line "--- SQL N ---" followed by only its SQL query, no explanation\n\nSQL Queries:'
+)
+_SQL_BATCH_GENERATION_CHUNKS = _compile_template(SQL_BATCH_GENERATION_TEMPLATE)
+
+# Questions per batched prompt; larger batches give diminishing returns
+_SQL_BATCH_SIZE = 6
+
+_SQL_BATCH_DELIMITER_RE = re.compile(r'^[ \t]*-{3}\s*SQL\s+(\d+)\s*-{3}[ \t]*$', re.MULTILINE | re.IGNORECASE)
+
+QUESTION_DECOMPOSITION_TEMPLATE = """Break this question into independent sub-questions that can each be answered with a single SQL query:
+{question}
+
+If the question cannot be split, return it unchanged as the only item.
+
+Return only a JSON array of strings, no explanation.
+
+Sub-questions:"""
+_QUESTION_DECOMPOSITION_CHUNKS = _compile_template(QUESTION_DECOMPOSITION_TEMPLATE)
+
+@dataclass(frozen=True, slots=True)
+class LLMClient:
+    """OpenRouter call settings resolved once from config."""
+    # A requests.Session; requests is imported lazily, so it can't be named here
+    session: object
+    headers: dict
+    model: str
+    timeout: int
+    max_tokens: int
+    debug: bool
+    
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            session=_session(config.get('llm_max_concurrency', 4)),
+            headers={'Authorization': f"Bearer {config['openrouter_api_key']}"},
+            model=config.get('llm_model', 'anthropic/claude-3.5-sonnet'),
+            timeout=config.get('llm_timeout', 30),
+            max_tokens=config.get('max_response_length', 2000),
+            debug=bool(config.get('debug'))
+        )
+
+_RATE_LIMIT_ERROR = 'Rate limit exceeded'
+
+# Last (config, client) pair; load_config returns one cached config object,
+# so an identity check is enough to reuse the client
+_CLIENT_ENTRY = None
+
+def get_llm_client(config):
+    """Return an LLMClient for config, reusing it while the same config object is passed."""
+    global _CLIENT_ENTRY
+    if isinstance(config, LLMClient):
+        return config
+    entry = _CLIENT_ENTRY
+    if entry is not None and entry[0] is config:
+        return entry[1]
+    client = LLMClient.from_config(config)
+    _CLIENT_ENTRY = (config, client)
+    return client
+
+def _encode_body(data):
+    """Serialize a request body to UTF-8 JSON bytes, with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _http_error(response):
+    """Report a non-200 OpenRouter response and return its error dict.
+    
+    Rate limits and server errors are marked 'transient', since a later
+    call may succeed.
+    """
+    if response.status_code == 401:
+        print("OpenRouter API error: Invalid API key")
+        return {'error': 'Invalid API key'}
+    elif response.status_code == 429:
+        print("OpenRouter API error: Rate limit exceeded")
+        return {'error': _RATE_LIMIT_ERROR, 'transient': True}
+    else:
+        print(f"OpenRouter API error: HTTP {response.status_code}")
+        try:
+            error_data = response.json()
+            print(f"Error details: {error_data}")
+        except:
+            pass
+        return {'error': f'HTTP {response.status_code}', 'transient': response.status_code >= 500}
+
+def _raise_if_transient(response):
+    """Raise TransientError for a call_openrouter error that may clear on retry."""
+    if response.get('transient'):
+        raise TransientError(response['error'])
+
+def call_openrouter(config, messages, response_format=None):
+    """Make API call to OpenRouter. config may be a config mapping or an LLMClient."""
+    timeout = None
     try:
-        headers = {
-            'Authorization': f"Bearer {config['openrouter_api_key']}",
-            'Content-Type': 'application/json',
-            'HTTP-Referer': 'http://localhost',
-            'X-Title': 'SQL Agent'
-        }
+        client = get_llm_client(config)
+        timeout = client.timeout
         
         data = {
-            'model': config.get('llm_model', 'anthropic/claude-3.5-sonnet'),
+            'model': client.model,
             'messages': messages,
-            'max_tokens': config.get('max_response_length', 2000),
+            'max_tokens': client.max_tokens,
             'temperature': 0.1
         }
+        if response_format:
+            data['response_format'] = response_format
         
-        timeout = config.get('llm_timeout', 30)
+        if client.debug:
+            print(f"Making OpenRouter API call with model: {client.model}")
         
-        if config.get('debug'):
-            print(f"Making OpenRouter API call with model: {data['model']}")
-        
-        response = requests.post(
-            'https://openrouter.ai/api/v1/chat/completions',
-            headers=headers,
-            json=data,
+        response = client.session.post(
+            OPENROUTER_URL,
+            headers=client.headers,
+            data=_encode_body(data),
             timeout=timeout
         )
         
         if response.status_code == 200:
-            result = response.json()
-            if config.get('debug'):
+            result = _loads(response.content)
+            if client.debug:
                 print(f"OpenRouter API success: {len(result.get('choices', []))} choices")
             return result
-        elif response.status_code == 401:
-            print("OpenRouter API error: Invalid API key")
-            return {'error': 'Invalid API key'}
-        elif response.status_code == 429:
-            print("OpenRouter API error: Rate limit exceeded")
-            return {'error': 'Rate limit exceeded'}
         else:
-            print(f"OpenRouter API error: HTTP {response.status_code}")
-            try:
-                error_data = response.json()
-                print(f"Error details: {error_data}")
-            except:
-                pass
-            return {'error': f'HTTP {response.status_code}'}
+            return _http_error(response)
             
-    except requests.exceptions.Timeout:
+    except _requests().exceptions.Timeout:
         print(f"OpenRouter API timeout after {timeout} seconds")
-        return {'error': 'Request timeout'}
-    except requests.exceptions.ConnectionError:
+        return {'error': 'Request timeout', 'transient': True}
+    except _requests().exceptions.ConnectionError:
         print("OpenRouter API connection error")
-        return {'error': 'Connection error'}
+        return {'error': 'Connection error', 'transient': True}
     except Exception as e:
         print(f"OpenRouter call error: {e}")
         return {'error': str(e)}
 
-def generate_sql(config, question, schema):
-    """Generate SQL query from natural language question."""
-    from database import format_schema_for_llm
+def stream_openrouter(config, messages, response_format=None):
+    """Yield response content from OpenRouter as it arrives over SSE.
+    
+    Errors are printed and end the stream early. The generator returns True
+    once the model finished its response and False when the call failed or
+    the stream was cut short (including at the max_tokens limit), so
+    callers can tell a partial response from a complete one. A call that
+    fails transiently before any content arrives raises TransientError
+    instead. Closing the generator hangs up on the response.
+    """
+    timeout = None
+    started = False
+    try:
+        client = get_llm_client(config)
+        timeout = client.timeout
+        data = {
+            'model': client.model,
+            'messages': messages,
+            'max_tokens': client.max_tokens,
+            'temperature': 0.1,
+            'stream': True
+        }
+        if response_format:
+            data['response_format'] = response_format
+        
+        if client.debug:
+            print(f"Streaming OpenRouter API call with model: {client.model}")
+        
+        with client.session.post(
+            OPENROUTER_URL,
+            headers=client.headers,
+            data=_encode_body(data),
+            timeout=timeout,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                _raise_if_transient(_http_error(response))
+                return False
+            
+            finish_reason = None
+            for line in response.iter_lines():
+                # SSE comments (": OPENROUTER PROCESSING") and blank keep-alives carry no data
+                if not line.startswith(b'data: '):
+                    continue
+                payload = line[6:]
+                if payload == b'[DONE]':
+                    break
+                choices = _loads(payload).get('choices')
+                if choices:
+                    finish_reason = choices[0].get('finish_reason') or finish_reason
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        started = True
+                        yield content
+            
+            if finish_reason is None or finish_reason == 'length':
+                print(f"OpenRouter stream ended early (finish reason: {finish_reason})")
+                return False
+            return True
+                        
+    except TransientError:
+        raise
+    except _requests().exceptions.Timeout as e:
+        print(f"OpenRouter API timeout after {timeout} seconds")
+        if not started:
+            raise TransientError('Request timeout') from e
+    except _requests().exceptions.ConnectionError as e:
+        print("OpenRouter API connection error")
+        if not started:
+            raise TransientError('Connection error') from e
+    except Exception as e:
+        print(f"OpenRouter stream error: {e}")
+    return False
+
+def _read_sql_stream(config, messages):
+    """Collect a streamed SQL answer, hanging up once a complete code block has arrived.
+    
+    Returns None when the stream ended before the answer was complete, so
+    partial SQL is never used or cached.
+    """
+    parts = []
+    stream = stream_openrouter(config, messages)
+    try:
+        while True:
+            try:
+                piece = next(stream)
+            except StopIteration as stop:
+                return ''.join(parts) if stop.value else None
+            parts.append(piece)
+            # Anything after the closing fence is explanation we don't need
+            if '`' in piece and _CODE_BLOCK_RE.search(''.join(parts)):
+                return ''.join(parts)
+    finally:
+        stream.close()
+
+def _sql_generation_messages(question, schema):
+    """Build the chat messages asking for SQL that answers question."""
     from datetime import date
     
-    schema_text = format_schema_for_llm(schema)
-    current_date = date.today().strftime('%Y-%m-%d')
+    prompt = _render(_bind_schema(_SQL_GENERATION_CHUNKS, _schema_text(schema)), {
+        'question': question,
+        'examples': select_sql_examples(question),
+        'current_date': date.today().strftime('%Y-%m-%d')
+    })
+    return [{'role': 'user', 'content': prompt}]
+
+def _extract_sql(content, structured):
+    """Pull the SQL query out of a generation response's message content."""
+    content = content.strip()
+    if structured:
+        try:
+            sql = _loads(content)['sql'].strip()
+            if sql:
+                return sql
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # Model ignored the schema; fall back to text parsing
+            pass
+    # Clean up the response - remove markdown formatting
+    return clean_sql_response(content)
+
+def generate_sql(config, question, schema):
+    """Generate SQL query from natural language question.
     
-    prompt = SQL_GENERATION_TEMPLATE.format(
-        schema=schema_text,
-        question=question,
-        current_date=current_date
-    )
+    schema may be the schema dict or text from database.get_schema_prompt;
+    passing the text skips re-formatting the schema on every question.
+    Returns None on failure, or raises TransientError when the API call
+    failed in a way that may clear on retry.
+    """
+    cache_key = question_key(question, schema, config.get('llm_model', ''))
+    cached_sql = get_cached_sql(config, cache_key)
+    if cached_sql:
+        if config.get('debug'):
+            print(f"Using cached SQL: {cached_sql}")
+        return cached_sql
     
-    messages = [{'role': 'user', 'content': prompt}]
+    messages = _sql_generation_messages(question, schema)
+    structured = config.get('llm_structured_output', False)
     
     try:
-        response = call_openrouter(config, messages)
-        
-        if response and 'error' in response:
-            print(f"SQL generation failed: {response['error']}")
-            return None
-            
-        if response and 'choices' in response and response['choices']:
-            sql = response['choices'][0]['message']['content'].strip()
-            
-            # Clean up the response - remove markdown formatting
-            sql = clean_sql_response(sql)
-            
-            if config.get('debug'):
-                print(f"Generated SQL: {sql}")
+        if not structured and config.get('llm_stream', True):
+            content = _read_sql_stream(config, messages)
+            if not content:
+                return None
+        else:
+            response = call_openrouter(config, messages, _SQL_RESPONSE_FORMAT if structured else None)
             
-            return sql
+            if response and 'error' in response:
+                print(f"SQL generation failed: {response['error']}")
+                _raise_if_transient(response)
+                return None
             
-        return None
+            if not (response and 'choices' in response and response['choices']):
+                return None
+            content = response['choices'][0]['message']['content']
+        
+        sql = _extract_sql(content, structured)
+        
+        if config.get('debug'):
+            print(f"Generated SQL: {sql}")
         
+        if sql:
+            cache_sql(config, cache_key, sql)
+        return sql
+        
+    except TransientError:
+        raise
     except Exception as e:
         print(f"SQL generation error: {e}")
         return None
 
+def decompose_question(config, question):
+    """Split a complex question into independent sub-questions."""
+    prompt = _render(_QUESTION_DECOMPOSITION_CHUNKS, {'question': question})
+    messages = [{'role': 'user', 'content': prompt}]
+    
+    try:
+        response = call_openrouter(config, messages)
+        
+        if response and 'choices' in response and response['choices']:
+            content = clean_sql_response(response['choices'][0]['message']['content'].strip())
+            sub_questions = json.loads(content)
+            if isinstance(sub_questions, list) and sub_questions and all(isinstance(q, str) for q in sub_questions):
+                if config.get('debug'):
+                    print(f"Decomposed into {len(sub_questions)} sub-questions: {sub_questions}")
+                return sub_questions
+                
+    except Exception as e:
+        print(f"Question decomposition error: {e}")
+    
+    return [question]
+
+def generate_decomposed(config, question, schema):
+    """Decompose a question and generate SQL for each sub-question concurrently.
+    
+    Returns a list of {'question': ..., 'sql': ...} dicts in sub-question order;
+    'sql' is None where generation failed.
+    """
+    sub_questions = decompose_question(config, question)
+    if len(sub_questions) == 1:
+        return [{'question': sub_questions[0], 'sql': generate_sql(config, sub_questions[0], schema)}]
+    
+    workers = min(len(sub_questions), config.get('llm_max_concurrency', 4))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        sqls = list(executor.map(lambda q: generate_sql(config, q, schema), sub_questions))
+    
+    return [{'question': q, 'sql': sql} for q, sql in zip(sub_questions, sqls)]
+
+def parse_sql_batch(content, count):
+    """Split a batched response on its '--- SQL N ---' delimiters.
+    
+    Returns a list of count SQL strings in question order; entries the
+    model skipped or left empty are None.
+    """
+    sqls = [None] * count
+    parts = _SQL_BATCH_DELIMITER_RE.split(content)
+    # split() yields [preamble, n1, body1, n2, body2, ...]
+    for number, body in zip(parts[1::2], parts[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count and sqls[index] is None:
+            sqls[index] = clean_sql_response(body.strip()) or None
+    return sqls
+
+def _generate_sql_chunk(config, questions, schema):
+    """Generate SQL for a few questions with one API call; None where parsing failed."""
+    from datetime import date
+    
+    prompt = _render(_bind_schema(_SQL_BATCH_GENERATION_CHUNKS, _schema_text(schema)), {
+        'questions': '\n'.join(f"Question {i}: {q}" for i, q in enumerate(questions, 1)),
+        'examples': select_sql_examples(' '.join(questions), limit=len(_SQL_EXAMPLES)),
+        'current_date': date.today().strftime('%Y-%m-%d')
+    })
+    
+    try:
+        response = call_openrouter(config, [{'role': 'user', 'content': prompt}])
+        if response and 'choices' in response and response['choices']:
+            return parse_sql_batch(response['choices'][0]['message']['content'], len(questions))
+        if response and 'error' in response:
+            print(f"Batched SQL generation failed: {response['error']}")
+    except Exception as e:
+        print(f"Batched SQL generation error: {e}")
+    
+    return [None] * len(questions)
+
+def generate_sql_batch(config, questions, schema, batch_size=_SQL_BATCH_SIZE):
+    """Generate SQL for several questions, packing up to batch_size into each API call.
+    
+    Returns a list of SQL strings (None on failure) in question order.
+    Questions whose SQL could not be parsed from a batch are retried with
+    a single-question prompt.
+    """
+    sqls = [None] * len(questions)
+    pending = []
+    for i, question in enumerate(questions):
+        cached_sql = get_cached_sql(config, question_key(question, schema, config.get('llm_model', '')))
+        if cached_sql:
+            sqls[i] = cached_sql
+        else:
+            pending.append(i)
+    
+    if len(pending) == 1:
+        sqls[pending[0]] = generate_sql(config, questions[pending[0]], schema)
+        return sqls
+    
+    chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    workers = max(1, min(len(chunks), config.get('llm_max_concurrency', 4)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda chunk: _generate_sql_chunk(config, [questions[i] for i in chunk], schema), chunks)
+        for chunk, chunk_sqls in zip(chunks, results):
+            for i, sql in zip(chunk, chunk_sqls):
+                if sql:
+                    sqls[i] = sql
+                    cache_sql(config, question_key(questions[i], schema, config.get('llm_model', '')), sql)
+    
+    for i in pending:
+        if sqls[i] is None:
+            if config.get('debug'):
+                print(f"Batch parse failed for question {i + 1}, retrying individually")
+            sqls[i] = generate_sql(config, questions[i], schema)
+    
+    return sqls
+
 def clean_sql_response(sql):
     """Clean SQL response from LLM."""
     if not sql:
         return sql
     
-    # Remove markdown code blocks
-    lines = sql.split('\n')
-    cleaned_lines = []
-    in_code_block = False
-    
-    for line in lines:
-        stripped = line.strip()
-        if stripped.startswith('```'):
-            in_code_block = not in_code_block
-            continue
-        # Include lines when we're in a code block OR when we have content outside code blocks
-        if (in_code_block and stripped) or (not in_code_block and stripped):
-            cleaned_lines.append(line)
-    
-    result = '\n'.join(cleaned_lines).strip()
-    
-    # Remove common prefixes
-    prefixes = ['SQL Query:', 'Query:', 'SQL:']
-    for prefix in prefixes:
-        if result.startswith(prefix):
-            result = result[len(prefix):].strip()
+    # Prefer the contents of a fenced code block when there is one
+    match = _CODE_BLOCK_RE.search(sql)
+    if match:
+        sql = match.group(1)
     
-    return result
+    # Drop stray fence lines and blank lines, then any leading label
+    result = _NOISE_LINE_RE.sub('', sql).strip()
+    match = _SQL_PREFIX_RE.match(result)
+    if match:
+        result = result[match.end():]
+    return result.strip()
+
+# Column names that hold time values (stored in microseconds)
+_TIME_COLUMN_RE = re.compile(r'time|spent|hours', re.IGNORECASE)
+
+def _format_time_value(value):
+    # Convert large numbers that look like time in microseconds to hours
+    if isinstance(value, (int, float)) and value > 3600000:
+        return f"{value / 3600000000.0:.1f} hours"
+    return _format_number_value(value)
+
+def _format_number_value(value):
+    # Format other large numbers
+    if isinstance(value, (int, float)) and value > 1000000:
+        return f"{value:,}"
+    return value
 
 def format_and_enhance_data(data, question):
     """Format and enhance data with business context."""
-    if not data or isinstance(data, dict) and 'error' in data:
+    if not data or not isinstance(data, list):
         return data
     
+    # Rows share the same columns, so pick each column's formatter once
+    formatters = {
+        key: _format_time_value if _TIME_COLUMN_RE.search(key) else _format_number_value
+        for key in data[0]
+    }
+    
     # Convert time values and add context
-    enhanced_data = []
-    for row in data:
-        enhanced_row = {}
-        for key, value in row.items():
-            # Convert large numbers that look like time in microseconds to hours
-            if isinstance(value, (int, float)) and value > 3600000 and ('time' in key.lower() or 'spent' in key.lower() or 'hours' in key.lower()):
-                hours = value / 3600000000.0
-                enhanced_row[key] = f"{hours:.1f} hours"
-            # Format other large numbers
-            elif isinstance(value, (int, float)) and value > 1000000:
-                enhanced_row[key] = f"{value:,}"
-            else:
-                enhanced_row[key] = value
-        enhanced_data.append(enhanced_row)
-    
-    return enhanced_data
+    return [
+        {key: formatters.get(key, _format_number_value)(value) for key, value in row.items()}
+        for row in data
+    ]
 
-def generate_response(config, question, data):
-    """Generate natural language response from query results."""
+# Any Cyrillic letter (Russian and Ukrainian alphabets), in either case
+_CYRILLIC_RE = re.compile(r'[а-яёіїєґ]', re.IGNORECASE)
+
+@lru_cache(maxsize=256)
+def _language_instruction(language, question):
+    """Pick the response language instruction; cached across retries of a question."""
+    if language == 'auto':
+        # Simple detection based on question content
+        if _CYRILLIC_RE.search(question):
+            return "Please respond in Ukrainian."
+        return "Please respond in English."
+    elif language == 'ukrainian':
+        return "Please respond in Ukrainian."
+    elif language == 'english':
+        return "Please respond in English."
+    return ""
+
+# Compact JSON text for prompts; orjson is optional and much faster on wide rows
+if orjson is not None:
+    def _dumps(value):
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+else:
+    def _dumps(value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+# Number of result rows included in the response prompt
+_PROMPT_PREVIEW_ROWS = 10
+
+# Rough characters per token for prompt budgeting; close enough for JSON
+# rows and prose without shipping a tokenizer
+_CHARS_PER_TOKEN = 4
+_RESPONSE_TEMPLATE_CHARS = len(RESPONSE_GENERATION_TEMPLATE) + 40  # plus language instruction
+
+def _serialize_for_prompt(data):
+    """Serialize query results compactly, one JSON row per line.
+    
+    Pretty-printed JSON roughly triples the prompt size in whitespace tokens;
+    dates and other non-JSON values are rendered with str().
+    """
+    if isinstance(data, list):
+        return '\n'.join(map(_dumps, data))
+    return _dumps(data)
+
+def _response_prompt(config, question, data):
+    """Build the answer prompt for query results.
+    
+    Returns (prompt, None), or (None, message) when the results need no
+    model call (no rows, or an error dict).
+    """
+    streamed = data is not None and not isinstance(data, (list, dict))
+    if streamed:
+        # Pull one row past the preview to know whether more rows exist
+        data = list(itertools.islice(data, _PROMPT_PREVIEW_ROWS + 1))
+    
     # Handle empty or error results
     if not data:
-        return "No results found for your question."
+        return None, "No results found for your question."
     
     if isinstance(data, dict) and 'error' in data:
-        return f"There was an error processing your question: {data['error']}"
-    
-    # Enhance data with formatting and context
-    data = format_and_enhance_data(data, question)
+        return None, f"There was an error processing your question: {data['error']}"
     
     # Determine language instruction
-    language = config.get('response_language', 'auto')
-    if language == 'auto':
-        # Simple detection based on question content
-        if any(char in question for char in 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'):
-            language_instruction = "Please respond in Ukrainian."
-        else:
-            language_instruction = "Please respond in English."
-    elif language == 'ukrainian':
-        language_instruction = "Please respond in Ukrainian."
-    elif language == 'english':
-        language_instruction = "Please respond in English."
-    else:
-        language_instruction = ""
+    language_instruction = _language_instruction(config.get('response_language', 'auto'), question)
     
-    # Format data for prompt
-    if isinstance(data, list) and len(data) > 10:
-        # Truncate long results
-        data_text = json.dumps(data[:10], indent=2, ensure_ascii=False)
-        data_text += f"\n... and {len(data) - 10} more rows"
+    if isinstance(data, list):
+        # Truncate long results first so only the preview rows get enhanced
+        lines = list(map(_dumps, format_and_enhance_data(data[:_PROMPT_PREVIEW_ROWS], question)))
+        
+        # Drop trailing preview rows until the prompt fits the token budget,
+        # always keeping at least one row
+        keep = len(lines)
+        budget = config.get('llm_max_prompt_tokens', 4000)
+        if budget > 0:
+            room = budget * _CHARS_PER_TOKEN - len(question) - _RESPONSE_TEMPLATE_CHARS
+            used = sum(map(len, lines)) + keep
+            while keep > 1 and used > room:
+                keep -= 1
+                used -= len(lines[keep]) + 1
+            if keep < len(lines):
+                print(f"Warning: sending {keep} of {len(lines)} preview rows to stay within {budget} prompt tokens")
+        
+        data_text = '\n'.join(lines[:keep])
+        if streamed and len(data) > _PROMPT_PREVIEW_ROWS:
+            data_text += "\n... and more rows"
+        elif len(data) > keep:
+            data_text += f"\n... and {len(data) - keep} more rows"
     else:
-        data_text = json.dumps(data, indent=2, ensure_ascii=False)
+        data_text = _serialize_for_prompt(format_and_enhance_data(data, question))
     
-    prompt = RESPONSE_GENERATION_TEMPLATE.format(
-        question=question,
-        data=data_text,
-        language_instruction=language_instruction
-    )
+    prompt = _render(_RESPONSE_GENERATION_CHUNKS, {
+        'question': question,
+        'data': data_text,
+        'language_instruction': language_instruction
+    })
+    return prompt, None
+
+def generate_response(config, question, data):
+    """Generate natural language response from query results.
+    
+    data may be a list of rows, an error/status dict, or an iterator of rows;
+    iterators are consumed only as far as the prompt preview needs. Raises
+    TransientError when the API call failed in a way that may clear on retry.
+    """
+    prompt, message = _response_prompt(config, question, data)
+    if prompt is None:
+        return message
     
     messages = [{'role': 'user', 'content': prompt}]
     
+    # The prompt covers the question, language and result preview, so an
+    # identical prompt can reuse the earlier answer
+    cache_key = prompt_key(prompt, config.get('llm_model', ''))
+    cached_response = get_cached_response(config, cache_key)
+    if cached_response:
+        return cached_response
+    
     try:
         response = call_openrouter(config, messages)
         
         if response and 'error' in response:
             print(f"Response generation failed: {response['error']}")
+            _raise_if_transient(response)
             return "I encountered an error while generating a response to your question."
             
         if response and 'choices' in response and response['choices']:
             result = response['choices'][0]['message']['content'].strip()
             
             # Remove common prefixes
-            prefixes = ['Answer:', 'Response:']
-            for prefix in prefixes:
-                if result.startswith(prefix):
-                    result = result[len(prefix):].strip()
+            match = _ANSWER_PREFIX_RE.match(result)
+            if match:
+                result = result[match.end():]
             
             if config.get('debug'):
                 print(f"Generated response length: {len(result)}")
             
+            if result:
+                cache_response(config, cache_key, result)
             return result
             
         return "I was unable to generate a response to your question."
         
+    except TransientError:
+        raise
     except Exception as e:
         print(f"Response generation error: {e}")
         return "I encountered an error while processing your question."
 
+# Enough leading text to see past any "Answer:"-style prefix before
+# passing streamed chunks through
+_ANSWER_PREFIX_WINDOW = 32
+
+# Appended to a streamed answer whose stream ended before the model finished
+_ANSWER_CUT_OFF_NOTICE = "\n\n[The answer was cut off before it was complete.]"
+
+def _tracked(stream, status):
+    """Pass a stream_openrouter stream through, storing whether it completed in status['completed']."""
+    status['completed'] = yield from stream
+
+def generate_response_stream(config, question, data):
+    """Yield the natural language answer in chunks as the model writes it.
+    
+    Same prompt and cache as generate_response; fixed messages and cached
+    answers come out as a single chunk. A failed call yields nothing, so
+    callers can tell it apart from an answer, or raises TransientError
+    when the failure may clear on retry; an answer cut off partway ends
+    with a notice saying so and is not cached.
+    """
+    prompt, message = _response_prompt(config, question, data)
+    if prompt is None:
+        yield message
+        return
+    
+    cache_key = prompt_key(prompt, config.get('llm_model', ''))
+    cached_response = get_cached_response(config, cache_key)
+    if cached_response:
+        yield cached_response
+        return
+    
+    messages = [{'role': 'user', 'content': prompt}]
+    parts = []
+    head = ''
+    status = {}
+    for chunk in _tracked(stream_openrouter(config, messages), status):
+        if head is not None:
+            # Hold the first few chunks back so a prefix split across them is still stripped
+            head += chunk
+            if len(head.lstrip()) < _ANSWER_PREFIX_WINDOW:
+                continue
+            chunk, head = head.lstrip(), None
+            match = _ANSWER_PREFIX_RE.match(chunk)
+            if match:
+                chunk = chunk[match.end():]
+        parts.append(chunk)
+        yield chunk
+    
+    if head:
+        chunk = head.strip()
+        match = _ANSWER_PREFIX_RE.match(chunk)
+        if match:
+            chunk = chunk[match.end():]
+        if chunk:
+            parts.append(chunk)
+            yield chunk
+    
+    result = ''.join(parts).strip()
+    if not result:
+        return
+    if not status['completed']:
+        yield _ANSWER_CUT_OFF_NOTICE
+        return
+    
+    if config.get('debug'):
+        print(f"Generated response length: {len(result)}")
+    cache_response(config, cache_key, result)
+
 
 def fix_sql_error(config, sql, error_message, schema):
-    """Fix SQL query based on error message."""
-    from database import format_schema_for_llm
-    schema_text = format_schema_for_llm(schema)
+    """Fix SQL query based on error message.
     
-    prompt = SQL_ERROR_CORRECTION_TEMPLATE.format(
-        schema=schema_text,
-        sql=sql,
-        error=error_message
-    )
+    schema may be the schema dict or text from database.get_schema_prompt.
+    """
+    prompt = _render(_bind_schema(_SQL_ERROR_CORRECTION_CHUNKS, _schema_text(schema)), {
+        'sql': sql,
+        'error': str(error_message)
+    })
     
     messages = [{'role': 'user', 'content': prompt}]
     
@@ -401,17 +1086,138 @@ def fix_sql_error(config, sql, error_message, schema):
         print(f"SQL error correction error: {e}")
         return None
 
+# Async variants run the blocking calls on worker threads over the shared
+# session pool, so independent LLM calls can be awaited together with
+# asyncio.gather while still reusing keep-alive connections.
+async def acall_openrouter(config, messages, response_format=None):
+    """Async variant of call_openrouter."""
+    return await asyncio.to_thread(call_openrouter, config, messages, response_format)
+
+async def agenerate_sql(config, question, schema):
+    """Async variant of generate_sql."""
+    return await asyncio.to_thread(generate_sql, config, question, schema)
+
+async def agenerate_response(config, question, data):
+    """Async variant of generate_response."""
+    return await asyncio.to_thread(generate_response, config, question, data)
+
+async def afix_sql_error(config, sql, error_message, schema):
+    """Async variant of fix_sql_error."""
+    return await asyncio.to_thread(fix_sql_error, config, sql, error_message, schema)
+
+# App-level retries after urllib3's own 429 retries are exhausted
+_BATCH_MAX_RETRIES = 3
+_BATCH_BACKOFF_BASE = 1.0
+
+class _RateLimiter:
+    """Token bucket keeping API calls under a requests-per-minute cap."""
+    
+    def __init__(self, rpm, burst):
+        self.rate = rpm / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def _batch_clients(config):
+    """One LLMClient per configured API key, so calls can spread across keys."""
+    client = get_llm_client(config)
+    keys = config.get('openrouter_api_keys') or ()
+    if not keys:
+        return [client]
+    return [replace(client, headers={'Authorization': f"Bearer {key}"}) for key in keys]
+
+async def arun_batch(config, questions, schema, max_concurrency=None, rpm=None):
+    """Generate SQL for many questions concurrently under concurrency and rate limits.
+    
+    Returns a list of SQL strings (None on failure) in question order.
+    """
+    max_concurrency = max_concurrency or config.get('llm_max_concurrency', 4)
+    rpm = config.get('llm_rpm', 0) if rpm is None else rpm
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = _RateLimiter(rpm, max_concurrency) if rpm > 0 else None
+    clients = _batch_clients(config)
+    structured = config.get('llm_structured_output', False)
+    response_format = _SQL_RESPONSE_FORMAT if structured else None
+    
+    async def one(question):
+        cache_key = question_key(question, schema, config.get('llm_model', ''))
+        cached_sql = get_cached_sql(config, cache_key)
+        if cached_sql:
+            return cached_sql
+        
+        messages = _sql_generation_messages(question, schema)
+        for attempt in range(_BATCH_MAX_RETRIES + 1):
+            async with semaphore:
+                if limiter:
+                    await limiter.acquire()
+                response = await acall_openrouter(random.choice(clients), messages, response_format)
+            
+            if response and response.get('error') == _RATE_LIMIT_ERROR and attempt < _BATCH_MAX_RETRIES:
+                # Exponential backoff with jitter, outside the semaphore
+                await asyncio.sleep(_BATCH_BACKOFF_BASE * 2 ** attempt + random.uniform(0, _BATCH_BACKOFF_BASE))
+                continue
+            break
+        
+        if response and 'error' in response:
+            print(f"SQL generation failed: {response['error']}")
+            return None
+        if response and response.get('choices'):
+            sql = _extract_sql(response['choices'][0]['message']['content'], structured)
+            if sql:
+                cache_sql(config, cache_key, sql)
+            return sql
+        return None
+    
+    return await asyncio.gather(*(one(question) for question in questions))
+
+def run_batch(config, questions, schema, max_concurrency=None, rpm=None):
+    """Synchronous entry point for arun_batch."""
+    return asyncio.run(arun_batch(config, questions, schema, max_concurrency, rpm))
+
+OPENROUTER_KEY_URL = 'https://openrouter.ai/api/v1/auth/key'
+
+# Seconds a connectivity check result is reused
+_OPENROUTER_CHECK_TTL = 60
+
+# API key -> (checked_at, ok)
+_OPENROUTER_CHECKS = {}
+
 def test_openrouter(config):
-    """Test OpenRouter API connection."""
+    """Test OpenRouter API connection.
+    
+    Checks the API key against the key-info endpoint instead of running a
+    completion, so no tokens are spent; results are reused for a minute.
+    """
+    api_key = config.get('openrouter_api_key')
+    entry = _OPENROUTER_CHECKS.get(api_key)
+    if entry is not None and time.monotonic() - entry[0] < _OPENROUTER_CHECK_TTL:
+        return entry[1]
+    
     try:
-        messages = [{'role': 'user', 'content': 'Say "test successful"'}]
-        response = call_openrouter(config, messages)
-        
-        if response and 'choices' in response:
-            content = response['choices'][0]['message']['content']
-            return 'test successful' in content.lower()
-        return False
+        response = _session().get(
+            OPENROUTER_KEY_URL,
+            headers={'Authorization': f"Bearer {api_key}"},
+            timeout=min(config.get('llm_timeout', 30), 5)
+        )
+        ok = response.status_code == 200
+        if not ok:
+            print(f"OpenRouter API error: HTTP {response.status_code}")
         
     except Exception as e:
         print(f"OpenRouter test error: {e}")
-        return False
\ No newline at end of file
+        return False
+    
+    _OPENROUTER_CHECKS[api_key] = (time.monotonic(), ok)
+    return ok
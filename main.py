@@ -1,11 +1,47 @@
 import click
+import logging
+import random
+import re
+import threading
 import time
 import sys
-from config import load_config, validate_config
-from database import connect_db, test_connection, get_vacation_info, get_schema, execute_query, format_schema_for_llm
-from llm import test_openrouter, generate_sql, generate_response, fix_sql_error, clean_sql_response
-from vacation import load_vacation_data, format_vacation_info
-from utils import is_safe_query, clean_sql
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import lru_cache, wraps
+from config import load_config, load_validated_config, validate_config
+
+# Step-by-step detail for debug mode. Messages are only formatted when the
+# level is enabled, so normal runs skip that work entirely.
+logger = logging.getLogger(__name__)
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter('%(message)s'))
+logger.addHandler(_log_handler)
+logger.propagate = False
+logger.setLevel(logging.WARNING)
+
+def _set_debug(debug):
+    """Set the log level for the whole process; call once per CLI command."""
+    logger.setLevel(logging.DEBUG if debug else logging.WARNING)
+
+def _start_background(fn, *args, **kwargs):
+    """Run fn on its own daemon thread and return a Future for its result.
+    
+    Used for work that overlaps the LLM round trip, such as vacation data
+    prep. Each question gets its own threads, so concurrent questions don't
+    queue behind each other, and work whose result is no longer wanted
+    doesn't hold up interpreter exit.
+    """
+    future = Future()
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, name='sql-agent-background', daemon=True).start()
+    return future
 
 # Color codes for CLI output
 class Colors:
@@ -17,25 +53,39 @@ class Colors:
     ENDC = '\033[0m'
     BOLD = '\033[1m'
 
+# Piped or redirected output gets plain text; checked once at import
+if not sys.stdout.isatty():
+    for _name in ('HEADER', 'BLUE', 'GREEN', 'YELLOW', 'RED', 'ENDC', 'BOLD'):
+        setattr(Colors, _name, '')
+    del _name
+
+_SUCCESS_PREFIX = f"{Colors.GREEN}✓ "
+_ERROR_PREFIX = f"{Colors.RED}✗ "
+_WARNING_PREFIX = f"{Colors.YELLOW}⚠ "
+_INFO_PREFIX = f"{Colors.BLUE}ℹ "
+_HEADER_PREFIX = f"{Colors.BOLD}{Colors.HEADER}=== "
+_HEADER_SUFFIX = f" ==={Colors.ENDC}"
+_RESET = Colors.ENDC
+
 def print_success(message):
     """Print success message in green."""
-    print(f"{Colors.GREEN}✓ {message}{Colors.ENDC}")
+    print(_SUCCESS_PREFIX, message, _RESET, sep="")
 
 def print_error(message):
     """Print error message in red."""
-    print(f"{Colors.RED}✗ {message}{Colors.ENDC}")
+    print(_ERROR_PREFIX, message, _RESET, sep="")
 
 def print_warning(message):
     """Print warning message in yellow."""
-    print(f"{Colors.YELLOW}⚠ {message}{Colors.ENDC}")
+    print(_WARNING_PREFIX, message, _RESET, sep="")
 
 def print_info(message):
     """Print info message in blue."""
-    print(f"{Colors.BLUE}ℹ {message}{Colors.ENDC}")
+    print(_INFO_PREFIX, message, _RESET, sep="")
 
 def print_header(message):
     """Print header message in bold."""
-    print(f"{Colors.BOLD}{Colors.HEADER}=== {message} ==={Colors.ENDC}")
+    print(_HEADER_PREFIX, message, _HEADER_SUFFIX, sep="")
 
 def format_question_answer(question, answer, elapsed_time=None):
     """Format question and answer nicely."""
@@ -44,6 +94,21 @@ def format_question_answer(question, answer, elapsed_time=None):
     if elapsed_time:
         print(f"{Colors.BLUE}Processing time: {elapsed_time:.2f}s{Colors.ENDC}")
 
+def answer_writer(label="Answer:"):
+    """Return (write, written) for printing an answer to stdout as it streams in.
+    
+    The label is printed before the first chunk; written collects the chunks
+    so callers can tell whether anything was shown.
+    """
+    written = []
+    def write(chunk):
+        if not written:
+            sys.stdout.write(f"\n{Colors.BOLD}{label}{Colors.ENDC} ")
+        written.append(chunk)
+        sys.stdout.write(chunk)
+        sys.stdout.flush()
+    return write, written
+
 def format_table(data, headers=None):
     """Format data as a simple table."""
     if not data:
@@ -54,127 +119,243 @@ def format_table(data, headers=None):
             headers = list(data[0].keys())
         
         if headers:
-            # Calculate column widths
-            widths = [len(str(h)) for h in headers]
-            for row in data[:10]:  # Only check first 10 rows for width
-                for i, header in enumerate(headers):
-                    value = str(row.get(header, '')) if isinstance(row, dict) else str(row[i] if i < len(row) else '')
-                    widths[i] = max(widths[i], len(value))
+            # Pick the cell extractor once instead of checking each row's type
+            if isinstance(data[0], dict):
+                keys = tuple(headers)
+                def cells(row):
+                    return [str(row.get(h, '')) for h in keys]
+            else:
+                def cells(row):
+                    return [str(row[i] if i < len(row) else '') for i in range(len(headers))]
             
-            # Print header
-            header_row = " | ".join(str(h).ljust(widths[i]) for i, h in enumerate(headers))
-            print(f"{Colors.BOLD}{header_row}{Colors.ENDC}")
-            print("-" * len(header_row))
+            # Stringify the displayed rows once; widths and output both use them
+            headers = [str(h) for h in headers]
+            rows = [cells(row) for row in data[:10]]
+            widths = [max(len(h), *(len(row[i]) for row in rows)) for i, h in enumerate(headers)]
             
-            # Print rows (limit to first 10)
-            for i, row in enumerate(data[:10]):
-                if isinstance(row, dict):
-                    values = [str(row.get(h, '')) for h in headers]
-                else:
-                    values = [str(row[i] if i < len(row) else '') for i in range(len(headers))]
-                row_str = " | ".join(val.ljust(widths[i]) for i, val in enumerate(values))
-                print(row_str)
+            # Header, separator and rows (limit to first 10), written in one go
+            header_row = " | ".join(f"{h:<{width}}" for h, width in zip(headers, widths))
+            lines = [f"{Colors.BOLD}{header_row}{Colors.ENDC}", "-" * len(header_row)]
+            lines.extend(" | ".join(f"{value:<{width}}" for value, width in zip(row, widths)) for row in rows)
             
             if len(data) > 10:
-                print(f"{Colors.YELLOW}... and {len(data) - 10} more rows{Colors.ENDC}")
+                lines.append(f"{Colors.YELLOW}... and {len(data) - 10} more rows{Colors.ENDC}")
         else:
             # Simple list display
-            for i, item in enumerate(data[:10]):
-                print(f"{i+1}. {item}")
+            lines = [f"{i}. {item}" for i, item in enumerate(data[:10], 1)]
             if len(data) > 10:
-                print(f"{Colors.YELLOW}... and {len(data) - 10} more items{Colors.ENDC}")
+                lines.append(f"{Colors.YELLOW}... and {len(data) - 10} more items{Colors.ENDC}")
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
     else:
         print(str(data))
 
+def _handle_config_errors(label):
+    """Load and validate the config for a command, reporting any failure under label.
+    
+    The wrapped command receives the config as its first argument.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                config = load_validated_config()
+                return fn(config, *args, **kwargs)
+            except Exception as e:
+                print_error(f"{label}: {e}")
+                if "Missing required configuration" in str(e):
+                    print_info("💡 Tip: Copy .env.example to .env and fill in your database and API credentials")
+        return wrapper
+    return decorator
+
 @click.group()
 def cli():
     """Simple SQL Agent CLI."""
     pass
 
+# Keywords marking a question about vacation/time off (English, Russian, Ukrainian)
+# Stems are matched anywhere in the question, so inflected forms
+# ("відпустки", "vacations") need no entries of their own
+_VACATION_KEYWORDS = (
+    'vacation', 'holiday', 'time off', 'leave', 'sick',
+    'отпуск', 'каникулы', 'больничный', 'отгул',
+    'відпуст', 'канікул', 'лікарн', 'відгул',
+    'days off', 'time away'
+)
+_VACATION_RE = re.compile('|'.join(map(re.escape, _VACATION_KEYWORDS)), re.IGNORECASE)
+
+@lru_cache(maxsize=256)
 def is_vacation_question(question):
     """Check if question is about vacation/time off."""
-    vacation_keywords = [
-        'vacation', 'holiday', 'time off', 'leave', 'sick',
-        'отпуск', 'каникулы', 'больничный', 'отгул',
-        'відпуст', 'канікул', 'лікарн', 'відгул', 'днів провів у відпустці',
-        'vacation days', 'days off', 'time away'
-    ]
-    question_lower = question.lower()
-    return any(keyword in question_lower for keyword in vacation_keywords)
+    return _VACATION_RE.search(question) is not None
+
+@dataclass(frozen=True)
+class RetryConfig:
+    """Backoff policy for retrying transient failures."""
+    max_retries: int = 2
+    initial_delay: float = 0.5
+    max_delay: float = 8.0
+    backoff_factor: float = 2.0
+    jitter: float = 0.25
+    
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt (0-based)."""
+        return min(self.initial_delay * self.backoff_factor ** attempt, self.max_delay) + random.uniform(0, self.jitter)
 
-def process_question_with_retry(question, config, debug=False, max_retries=2):
-    """Process a question with retry logic for better results."""
+class TransientFailure(str):
+    """Answer text for an LLM or database failure that may clear on retry.
     
-    for attempt in range(max_retries + 1):
-        if debug and attempt > 0:
-            print(f"\n=== RETRY ATTEMPT {attempt} ===")
+    process_question returns one when a call raised TransientError (rate
+    limit, overload, timeout, dropped connection); it reads as any other
+    answer, but process_question_with_retry retries it.
+    """
+
+# Questions about a recent window get an explicit fallback range on retry
+_RECENT_TERMS_RE = re.compile(r'week|тиждень|recent|latest|останн|попередн', re.IGNORECASE)
+
+def process_question_with_retry(question, config, debug=False, max_retries=2, retry=None, on_chunk=None, progress=True):
+    """Process a question with retry logic for better results.
+    
+    Transient failures are retried unchanged after an exponential backoff
+    with jitter; "No results found" is retried once with a broader scope.
+    on_chunk and progress are passed through to process_question.
+    """
+    retry = retry or RetryConfig(max_retries=max_retries)
+    transient_retries = 0
+    broadened = False
+    
+    for attempt in range(retry.max_retries + 1):
+        if attempt > 0:
+            logger.debug("\n=== RETRY ATTEMPT %d ===", attempt)
         
-        result = process_question(question, config, debug, attempt)
+        result = process_question(question, config, debug, attempt, on_chunk=on_chunk, progress=progress)
         
-        # If we got a result and it's not a "no results" error, return it
-        if result and not result.startswith("No results found"):
+        # If this was the last attempt, return the result anyway
+        if attempt == retry.max_retries:
             return result
         
-        # If this was the last attempt, return the result anyway
-        if attempt == max_retries:
+        if isinstance(result, TransientFailure):
+            delay = retry.delay(transient_retries)
+            transient_retries += 1
+            logger.debug("Transient failure, retrying in %.2fs: %s", delay, result)
+            time.sleep(delay)
+            continue
+        
+        # If we got a result and it's not a "no results" error, return it
+        if result and not result.startswith("No results found"):
             return result
             
         # For retry attempts, try broader temporal scope
-        if attempt == 0:
+        if not broadened:
+            broadened = True
             # First retry: expand time scope for better results
-            if any(term in question.lower() for term in ['week', 'тиждень', 'recent', 'latest', 'останн', 'попередн']):
+            if _RECENT_TERMS_RE.search(question):
                 modified_question = question + " (or expand to last 30 days if no recent data found)"
             else:
                 modified_question = question + " (consider broader date range if needed)"
             
-            if debug:
-                print(f"Retrying with broader scope: {modified_question}")
+            logger.debug("Retrying with broader scope: %s", modified_question)
             question = modified_question
     
     return "Unable to find results after multiple attempts."
 
-def process_question(question, config, debug=False, attempt=0):
-    """Process a natural language question end-to-end."""
-    start_time = time.time()
+# Rows of a query result the answer prompt shows the model; process_question
+# fetches just one more than this
+_RESULT_PREVIEW_ROWS = 10
+
+def build_vacation_context(config):
+    """Summarize vacation data as extra context for the response prompt.
     
+    Returns (context, processed) where processed is the number of employees
+    with vacation summaries.
+    """
+    from database import execute_query
     try:
-        if debug:
-            print(f"\n=== DEBUG MODE ===")
-            print(f"Question: {question}")
-            print(f"Vacation question: {is_vacation_question(question)}")
+        from vacation import load_vacation_data, match_vacation_users, calculate_vacation_days
+        
+        # Load and process vacation data
+        vacation_data = load_vacation_data()
+        if not vacation_data:
+            return f"\n\nVacation data file not found or empty.", 0
+        
+        user_mapping = match_vacation_users(vacation_data, config)
+        vacation_summary = calculate_vacation_days(vacation_data, user_mapping)
+        
+        if not vacation_summary:
+            return f"\n\nVacation data available: {vacation_data.get('n_users', 0)} users, {vacation_data.get('n_requests', 0)} requests, but processing failed.", 0
+        
+        # Create detailed vacation context for Alpha team
+        alpha_vacation_details = []
+        for emp_id, summary in vacation_summary.items():
+            # Get employee name from database
+            emp_query = f"SELECT name FROM employee WHERE employee_id = {emp_id}"
+            emp_result = execute_query(config, emp_query)
+            emp_name = emp_result[0]['name'] if emp_result else f"Employee {emp_id}"
+            
+            # Calculate days since 2025-01-01
+            days_2025 = summary['by_year'].get(2025, 0)
+            alpha_vacation_details.append(f"{emp_name} ({emp_id}): {days_2025} days in 2025")
+        
+        return f"\n\nVacation Data Summary:\n" + "\n".join(alpha_vacation_details[:10]), len(vacation_summary)
+    except Exception as e:
+        logger.debug("Vacation processing failed: %s", e)
+        return f"\n\nVacation data processing error: {str(e)}", 0
+
+def process_question(question, config, debug=False, attempt=0, on_chunk=None, progress=True):
+    """Process a natural language question end-to-end.
+    
+    When on_chunk is given and the query returned rows, the answer is
+    streamed to it piece by piece as it is generated; the full answer is
+    still returned. progress=False drops the per-step progress lines, for
+    questions running side by side whose lines would interleave.
+    """
+    from database import get_schema, get_schema_prompt, execute_query
+    from llm import generate_sql, generate_response, generate_response_stream, fix_sql_error
+    from utils import TransientError, is_safe_query, clean_sql
+    start_time = time.perf_counter()
+    vacation_question = is_vacation_question(question)
+    
+    try:
+        logger.debug("\n=== DEBUG MODE ===\nQuestion: %s\nVacation question: %s", question, vacation_question)
         
         # Step 1: Get database schema
         if debug:
             print_header("Step 1: Getting database schema")
-        else:
+        elif progress:
             print_info("Getting database schema...")
         
         schema = get_schema(config)
         if not schema:
             return "Error: Unable to retrieve database schema."
         
-        if debug:
-            print_success(f"Schema loaded: {len(schema)} tables")
-            for table_name in schema.keys():
-                print(f"  - {table_name}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Schema loaded: %d tables", len(schema))
+            for table_name in schema:
+                logger.debug("  - %s", table_name)
+        
+        # Vacation data prep doesn't depend on the SQL, so start it now and
+        # let it overlap the LLM round trip
+        vacation_future = None
+        if vacation_question:
+            vacation_future = _start_background(build_vacation_context, config)
         
         # Step 2: Generate SQL
         if debug:
             print_header("Step 2: Generating SQL")
-        else:
+        elif progress:
             print_info("Generating SQL query...")
         
-        sql = generate_sql(config, question, schema)
+        schema_prompt = get_schema_prompt(config) or schema
+        sql = generate_sql(config, question, schema_prompt)
         if not sql:
             return "Error: Unable to generate SQL query for your question."
         
-        if debug:
-            print_success(f"Generated SQL: {sql}")
+        logger.debug("Generated SQL: %s", sql)
         
         # Step 3: Execute SQL with safety checks
         if debug:
             print_header("Step 3: Executing SQL")
-        else:
+        elif progress:
             print_info("Executing query...")
         
         # Clean the SQL
@@ -187,23 +368,22 @@ def process_question(question, config, debug=False, attempt=0):
             return "Error: Generated SQL query contains unsafe operations."
         
         # Execute query
-        results = execute_query(config, sql)
+        results = execute_query(config, sql, max_rows=_RESULT_PREVIEW_ROWS + 1)
         
         # Step 4: Handle SQL errors and retry if needed
         if results is None:
             if debug:
                 print_header("Step 4: SQL failed, attempting to fix")
-            else:
+            elif progress:
                 print_warning("Query failed, trying to fix...")
             
             # Try to fix the SQL once
-            fixed_sql = fix_sql_error(config, sql, "Query execution failed", schema)
+            fixed_sql = fix_sql_error(config, sql, "Query execution failed", schema_prompt)
             if fixed_sql:
                 fixed_sql = clean_sql(fixed_sql)
                 if fixed_sql and is_safe_query(fixed_sql):
-                    if debug:
-                        print_success(f"Fixed SQL: {fixed_sql}")
-                    results = execute_query(config, fixed_sql)
+                    logger.debug("Fixed SQL: %s", fixed_sql)
+                    results = execute_query(config, fixed_sql, max_rows=_RESULT_PREVIEW_ROWS + 1)
                     sql = fixed_sql  # Use fixed SQL for response generation
         
         # Check if we have results
@@ -213,59 +393,43 @@ def process_question(question, config, debug=False, attempt=0):
         if isinstance(results, dict) and 'error' in results:
             return f"Database error: {results['error']}"
         
-        if debug:
-            print(f"Query results: {len(results) if isinstance(results, list) else 1} rows")
+        # One row past the preview only signals that more exist; hand the rows
+        # on as an iterator so the answer says "more rows" without a count
+        more_rows = isinstance(results, list) and len(results) > _RESULT_PREVIEW_ROWS
+        if more_rows:
+            logger.debug("Query results: more than %d rows", _RESULT_PREVIEW_ROWS)
+        else:
+            logger.debug("Query results: %d rows", len(results) if isinstance(results, list) else 1)
         
         # Step 5: Handle vacation questions specially
         vacation_context = ""
-        if is_vacation_question(question):
+        if vacation_future is not None:
             if debug:
                 print_header("Step 5: Processing vacation question")
-            else:
+            elif progress:
                 print_info("Processing vacation data...")
             
-            try:
-                from vacation import load_vacation_data, match_vacation_users, calculate_vacation_days
-                
-                # Load and process vacation data
-                vacation_data = load_vacation_data()
-                if vacation_data:
-                    user_mapping = match_vacation_users(vacation_data, config)
-                    vacation_summary = calculate_vacation_days(vacation_data, user_mapping)
-                    
-                    if vacation_summary:
-                        # Create detailed vacation context for Alpha team
-                        alpha_vacation_details = []
-                        for emp_id, summary in vacation_summary.items():
-                            # Get employee name from database
-                            emp_query = f"SELECT name FROM employee WHERE employee_id = {emp_id}"
-                            emp_result = execute_query(config, emp_query)
-                            emp_name = emp_result[0]['name'] if emp_result else f"Employee {emp_id}"
-                            
-                            # Calculate days since 2025-01-01
-                            days_2025 = summary['by_year'].get(2025, 0)
-                            alpha_vacation_details.append(f"{emp_name} ({emp_id}): {days_2025} days in 2025")
-                        
-                        vacation_context = f"\n\nVacation Data Summary:\n" + "\n".join(alpha_vacation_details[:10])
-                        if debug:
-                            print_success(f"Processed vacation data for {len(vacation_summary)} employees")
-                    else:
-                        vacation_context = f"\n\nVacation data available: {vacation_data.get('n_users', 0)} users, {vacation_data.get('n_requests', 0)} requests, but processing failed."
-                else:
-                    vacation_context = f"\n\nVacation data file not found or empty."
-            except Exception as e:
-                vacation_context = f"\n\nVacation data processing error: {str(e)}"
-                if debug:
-                    print_warning(f"Vacation processing failed: {e}")
+            vacation_context, processed = vacation_future.result()
+            if processed:
+                logger.debug("Processed vacation data for %d employees", processed)
         
         # Step 6: Generate natural language response
         if debug:
             print_header("Step 6: Generating response")
-        else:
+        elif progress:
             print_info("Generating response...")
         
         enhanced_question = question + vacation_context
-        response = generate_response(config, enhanced_question, results)
+        if on_chunk is not None and isinstance(results, list) and results:
+            parts = []
+            for chunk in generate_response_stream(config, enhanced_question, iter(results) if more_rows else results):
+                parts.append(chunk)
+                on_chunk(chunk)
+            if not parts:
+                return "I encountered an error while generating a response to your question."
+            response = ''.join(parts)
+        else:
+            response = generate_response(config, enhanced_question, iter(results) if more_rows else results)
         
         if not response:
             # Fallback to basic summary
@@ -274,71 +438,69 @@ def process_question(question, config, debug=False, attempt=0):
             else:
                 response = "Query executed successfully."
         
-        # Add timing info
-        elapsed_time = time.time() - start_time
-        if debug:
-            print(f"\n--- Processing complete in {elapsed_time:.2f} seconds ---")
+        # Add timing info; callers time the whole run, retries included
+        logger.debug("\n--- Processing complete in %.2f seconds ---", time.perf_counter() - start_time)
         
         return response
         
+    except TransientError as e:
+        logger.debug("\n--- Temporary failure in processing ---\nError: %s", e)
+        return TransientFailure(f"Error: Temporary failure ({e}). Please try again.")
     except Exception as e:
-        if debug:
-            print(f"\n--- Error in processing ---")
-            print(f"Error: {e}")
+        logger.debug("\n--- Error in processing ---\nError: %s", e)
         return f"Error processing question: {str(e)}"
 
 @cli.command()
-def setup():
+@_handle_config_errors("Setup failed")
+def setup(config):
     """Check configuration and database connection."""
-    try:
-        print("Checking configuration...")
-        config = load_config()
-        validate_config(config)
-        print("✓ Configuration valid")
-        
-        print("Testing database connection...")
-        if test_connection(config):
-            print("✓ Database connection successful")
-        else:
-            print("✗ Database connection failed")
-            return
-        
-        print("Testing OpenRouter connection...")
-        if test_openrouter(config):
-            print("✓ OpenRouter connection successful")
-        else:
-            print("✗ OpenRouter connection failed")
-            return
-            
-        print("\nSetup complete! You can now use 'ask' command.")
+    from database import test_connection
+    from llm import test_openrouter
+    print("Checking configuration...")
+    print("✓ Configuration valid")
+    
+    # Both checks are network round trips; run them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        db_future = executor.submit(test_connection, config)
+        llm_future = executor.submit(test_openrouter, config)
+    
+    print("Testing database connection...")
+    if db_future.result():
+        print("✓ Database connection successful")
+    else:
+        print("✗ Database connection failed")
+        return
+    
+    print("Testing OpenRouter connection...")
+    if llm_future.result():
+        print("✓ OpenRouter connection successful")
+    else:
+        print("✗ OpenRouter connection failed")
+        return
         
-    except Exception as e:
-        print_error(f"Setup failed: {e}")
-        if "Missing required configuration" in str(e):
-            print_info("💡 Tip: Copy .env.example to .env and fill in your database and API credentials")
+    print("\nSetup complete! You can now use 'ask' command.")
 
 @cli.command()
 @click.argument('question')
-def ask(question):
+@_handle_config_errors("Configuration error")
+def ask(config, question):
     """Ask a natural language question."""
-    try:
-        config = load_config()
-        validate_config(config)
-        
-        start_time = time.time()
-        answer = process_question_with_retry(question, config, debug=False)
-        elapsed_time = time.time() - start_time
-        
+    _set_debug(False)
+    start_time = time.perf_counter()
+    write, written = answer_writer()
+    answer = process_question_with_retry(question, config, debug=False, on_chunk=write)
+    elapsed_time = time.perf_counter() - start_time
+    
+    if written:
+        print()
+        print(f"{Colors.BLUE}Processing time: {elapsed_time:.2f}s{Colors.ENDC}")
+    else:
         format_question_answer(question, answer, elapsed_time)
-        
-    except Exception as e:
-        print_error(f"Configuration error: {e}")
-        if "Missing required configuration" in str(e):
-            print_info("💡 Tip: Copy .env.example to .env and fill in your database and API credentials")
 
 @cli.command()
 def test_db():
     """Test database connection."""
+    from database import test_connection
     try:
         config = load_config()
         print("Testing database connection...")
@@ -354,6 +516,7 @@ def test_db():
 @cli.command()
 def test_llm():
     """Test OpenRouter connection."""
+    from llm import test_openrouter
     try:
         config = load_config()
         print("Testing OpenRouter connection...")
@@ -369,6 +532,7 @@ def test_llm():
 @cli.command()
 def test_vacation():
     """Test vacation data loading."""
+    from vacation import load_vacation_data
     try:
         print("Testing vacation data loading...")
         vacation_data = load_vacation_data()
@@ -387,203 +551,202 @@ def test_vacation():
 @cli.command()
 @click.argument('employee_id', type=int)
 @click.option('--year', type=int, help='Specific year to query')
-def vacation(employee_id, year):
+@_handle_config_errors("Vacation query failed")
+def vacation(config, employee_id, year):
     """Get vacation information for employee."""
-    try:
-        config = load_config()
-        validate_config(config)
-        
-        print(f"Getting vacation info for employee {employee_id}...")
-        if year:
-            print(f"Filtering for year {year}")
-        
-        vacation_info = get_vacation_info(config, employee_id, year)
-        
-        if 'error' in vacation_info:
-            print(f"Error: {vacation_info['error']}")
-        else:
-            formatted_info = format_vacation_info(vacation_info)
-            print(formatted_info)
-            
-    except Exception as e:
-        print(f"Vacation query failed: {e}")
+    from database import get_vacation_info
+    from vacation import format_vacation_info
+    print(f"Getting vacation info for employee {employee_id}...")
+    if year:
+        print(f"Filtering for year {year}")
+    
+    vacation_info = get_vacation_info(config, employee_id, year)
+    
+    if 'error' in vacation_info:
+        print(f"Error: {vacation_info['error']}")
+    else:
+        formatted_info = format_vacation_info(vacation_info)
+        print(formatted_info)
 
 @cli.command()
-def load_vacation():
+@_handle_config_errors("Vacation loading failed")
+def load_vacation(config):
     """Load and process vacation data."""
-    try:
-        config = load_config()
-        validate_config(config)
-        
-        from vacation import load_vacation_data, match_vacation_users, calculate_vacation_days
-        
-        # Load vacation data
-        vacation_data = load_vacation_data()
-        if not vacation_data:
-            print("Failed to load vacation data")
-            return
-        
-        # Match users
-        user_mapping = match_vacation_users(vacation_data, config)
-        if not user_mapping:
-            print("Failed to match vacation users")
-            return
-        
-        # Calculate vacation days
-        vacation_summary = calculate_vacation_days(vacation_data, user_mapping)
-        if not vacation_summary:
-            print("Failed to calculate vacation data")
-            return
-        
-        print("\nVacation data processing complete!")
-        print(f"Processed data for {len(vacation_summary)} employees")
-        
-    except Exception as e:
-        print(f"Vacation loading failed: {e}")
+    from vacation import load_vacation_data, match_vacation_users, calculate_vacation_days
+    
+    # Load vacation data
+    vacation_data = load_vacation_data()
+    if not vacation_data:
+        print("Failed to load vacation data")
+        return
+    
+    # Match users
+    user_mapping = match_vacation_users(vacation_data, config)
+    if not user_mapping:
+        print("Failed to match vacation users")
+        return
+    
+    # Calculate vacation days
+    vacation_summary = calculate_vacation_days(vacation_data, user_mapping, verbose=True)
+    if not vacation_summary:
+        print("Failed to calculate vacation data")
+        return
+    
+    print("\nVacation data processing complete!")
+    print(f"Processed data for {len(vacation_summary)} employees")
 
 @cli.command()
 @click.argument('question')
-def debug(question):
+@_handle_config_errors("Debug failed")
+def debug(config, question):
     """Ask a question with detailed debugging information."""
-    try:
-        config = load_config()
-        validate_config(config)
-        
-        print(f"Question: {question}")
-        answer = process_question(question, config, debug=True)
-        print(f"\nFinal Answer: {answer}")
-        
-    except Exception as e:
-        print_error(f"Debug failed: {e}")
-        if "Missing required configuration" in str(e):
-            print_info("💡 Tip: Copy .env.example to .env and fill in your database and API credentials")
+    _set_debug(True)
+    print(f"Question: {question}")
+    answer = process_question(question, config, debug=True)
+    print(f"\nFinal Answer: {answer}")
 
 @cli.command()
-def interactive():
+@_handle_config_errors("Interactive mode failed")
+def interactive(config):
     """Start interactive question session."""
-    try:
-        config = load_config()
-        validate_config(config)
-        
-        # Initialize conversation history
-        history = []
-        
-        print_header("SQL Agent Interactive Mode")
-        print_info("Welcome to the SQL Agent! Ask questions about your database in natural language.")
-        print()
-        print("📋 Available commands:")
-        print("  • help          - Show help and examples")
-        print("  • history       - Show conversation history")
-        print("  • clear         - Clear conversation history")
-        print("  • status        - Show system status")
-        print("  • debug <q>     - Process question with detailed debugging")
-        print("  • exit/quit     - Exit interactive mode")
-        print()
-        print("🌟 Example questions:")
-        print("  • How many employees are in the Alpha team?")
-        print("  • Who is currently on vacation?")
-        print("  • Show me the most active projects this week")
-        print("-" * 70)
-        
-        while True:
-            try:
-                question = input(f"\n{Colors.BOLD}Question:{Colors.ENDC} ").strip()
-                
-                if question.lower() in ['exit', 'quit']:
-                    print_success("Goodbye! Thanks for using SQL Agent.")
-                    break
-                
-                if not question:
-                    continue
-                
-                # Handle special commands
-                if question.lower() == 'help':
-                    print_info("SQL Agent Help")
-                    print()
-                    print("🎯 What I can do:")
-                    print("  • Answer questions about employees, teams, projects")
-                    print("  • Calculate project statistics and time tracking")
-                    print("  • Show vacation information and leave balances")
-                    print("  • Analyze team composition and specializations")
-                    print()
-                    print("💡 Tips for better results:")
-                    print("  • Be specific about what you want to know")
-                    print("  • Mention team names (Alpha, Beta, Fusion, etc.)")
-                    print("  • Ask about time periods (this week, last month, etc.)")
-                    print("  • Use 'debug <question>' to see processing steps")
-                    continue
-                
-                if question.lower() == 'history':
-                    if history:
-                        print_info(f"Conversation History ({len(history)} questions)")
-                        for i, (q, a, t) in enumerate(history, 1):
-                            print(f"{i}. {Colors.BOLD}Q:{Colors.ENDC} {q}")
-                            print(f"   {Colors.BOLD}A:{Colors.ENDC} {a[:100]}{'...' if len(a) > 100 else ''}")
-                            print(f"   {Colors.BLUE}Time: {t:.2f}s{Colors.ENDC}")
+    from database import get_table_count, prewarm_schema, invalidate_schema
+    from llm import prewarm_openrouter
+    from vacation import load_vacation_data
+    prewarm_openrouter(config)
+    prewarm_schema(config)
+    
+    # Initialize conversation history
+    history = []
+    
+    print_header("SQL Agent Interactive Mode")
+    print_info("Welcome to the SQL Agent! Ask questions about your database in natural language.")
+    print()
+    print("📋 Available commands:")
+    print("  • help          - Show help and examples")
+    print("  • history       - Show conversation history")
+    print("  • clear         - Clear conversation history and caches")
+    print("  • status        - Show system status")
+    print("  • debug <q>     - Process question with detailed debugging")
+    print("  • exit/quit     - Exit interactive mode")
+    print()
+    print("🌟 Example questions:")
+    print("  • How many employees are in the Alpha team?")
+    print("  • Who is currently on vacation?")
+    print("  • Show me the most active projects this week")
+    print("-" * 70)
+    
+    while True:
+        try:
+            question = input(f"\n{Colors.BOLD}Question:{Colors.ENDC} ").strip()
+            
+            if question.lower() in ['exit', 'quit']:
+                print_success("Goodbye! Thanks for using SQL Agent.")
+                break
+            
+            if not question:
+                continue
+            
+            # Handle special commands
+            if question.lower() == 'help':
+                print_info("SQL Agent Help")
+                print()
+                print("🎯 What I can do:")
+                print("  • Answer questions about employees, teams, projects")
+                print("  • Calculate project statistics and time tracking")
+                print("  • Show vacation information and leave balances")
+                print("  • Analyze team composition and specializations")
+                print()
+                print("💡 Tips for better results:")
+                print("  • Be specific about what you want to know")
+                print("  • Mention team names (Alpha, Beta, Fusion, etc.)")
+                print("  • Ask about time periods (this week, last month, etc.)")
+                print("  • Use 'debug <question>' to see processing steps")
+                continue
+            
+            if question.lower() == 'history':
+                if history:
+                    print_info(f"Conversation History ({len(history)} questions)")
+                    for i, (q, a, t) in enumerate(history, 1):
+                        print(f"{i}. {Colors.BOLD}Q:{Colors.ENDC} {q}")
+                        print(f"   {Colors.BOLD}A:{Colors.ENDC} {a[:100]}{'...' if len(a) > 100 else ''}")
+                        print(f"   {Colors.BLUE}Time: {t:.2f}s{Colors.ENDC}")
+                else:
+                    print_warning("No conversation history yet.")
+                continue
+            
+            if question.lower() == 'clear':
+                history.clear()
+                # Also drop cached schema, answers and vacation data so the
+                # next question sees fresh data
+                invalidate_schema(config)
+                load_vacation_data.cache_clear()
+                print_success("Conversation history and caches cleared.")
+                continue
+            
+            if question.lower() == 'status':
+                # Run a mini status check
+                print_info("Quick status check...")
+                try:
+                    tables = get_table_count(config)
+                    if tables:
+                        print_success(f"Database: Connected ({tables} tables)")
                     else:
-                        print_warning("No conversation history yet.")
-                    continue
-                
-                if question.lower() == 'clear':
-                    history.clear()
-                    print_success("Conversation history cleared.")
-                    continue
-                
-                if question.lower() == 'status':
-                    # Run a mini status check
-                    print_info("Quick status check...")
-                    try:
-                        schema = get_schema(config)
-                        if schema:
-                            print_success(f"Database: Connected ({len(schema)} tables)")
-                        else:
-                            print_error("Database: Connection issue")
-                    except:
                         print_error("Database: Connection issue")
-                    continue
-                
-                # Check if debug mode requested
-                debug_mode = False
-                if question.lower().startswith('debug '):
-                    debug_mode = True
-                    question = question[6:].strip()
-                
-                if not question:
-                    print_warning("Please provide a question after 'debug'")
-                    continue
-                
-                # Process the question
-                start_time = time.time()
-                answer = process_question_with_retry(question, config, debug=debug_mode)
-                elapsed_time = time.time() - start_time
-                
-                # Display result
-                if not debug_mode:
-                    print(f"\n{Colors.BOLD}Answer:{Colors.ENDC} {answer}")
-                    print_info(f"Processing time: {elapsed_time:.2f}s")
+                except:
+                    print_error("Database: Connection issue")
+                continue
+            
+            # Check if debug mode requested
+            debug_mode = False
+            if question.lower().startswith('debug '):
+                debug_mode = True
+                question = question[6:].strip()
+            
+            if not question:
+                print_warning("Please provide a question after 'debug'")
+                continue
+            
+            # Process the question; questions run one at a time here, so
+            # switching the level per question doesn't affect other work
+            _set_debug(debug_mode)
+            start_time = time.perf_counter()
+            write, written = answer_writer()
+            answer = process_question_with_retry(
+                question, config, debug=debug_mode,
+                on_chunk=None if debug_mode else write
+            )
+            elapsed_time = time.perf_counter() - start_time
+            
+            # Display result; a streamed answer is already on screen
+            if not debug_mode:
+                if written:
+                    print()
                 else:
-                    print(f"\n{Colors.BOLD}Final Answer:{Colors.ENDC} {answer}")
-                
-                # Add to history
-                history.append((question, answer, elapsed_time))
-                
-                print("-" * 70)
-                
-            except KeyboardInterrupt:
-                print("\n")
-                print_success("Goodbye! Thanks for using SQL Agent.")
-                break
-            except Exception as e:
-                print_error(f"Error processing question: {e}")
-                
-    except Exception as e:
-        print_error(f"Interactive mode failed: {e}")
-        if "Missing required configuration" in str(e):
-            print_info("💡 Tip: Copy .env.example to .env and fill in your database and API credentials")
+                    print(f"\n{Colors.BOLD}Answer:{Colors.ENDC} {answer}")
+                print_info(f"Processing time: {elapsed_time:.2f}s")
+            else:
+                print(f"\n{Colors.BOLD}Final Answer:{Colors.ENDC} {answer}")
+            
+            # Add to history
+            history.append((question, answer, elapsed_time))
+            
+            print("-" * 70)
+            
+        except KeyboardInterrupt:
+            print("\n")
+            print_success("Goodbye! Thanks for using SQL Agent.")
+            break
+        except Exception as e:
+            print_error(f"Error processing question: {e}")
 
 @cli.command()
-def test_questions():
+@click.option('--output', type=click.Path(dir_okay=False), help='Write each result to this JSONL file as it completes (replaces the file)')
+@_handle_config_errors("Test questions failed")
+def test_questions(config, output):
     """Run the 4 required test questions."""
+    import json
+    from database import prewarm_schema
+    from llm import prewarm_openrouter
     test_questions_list = [
         "How much on average do task estimates exceed actual time spent for Alpha team?",
         "What is the most active project in Fusion team by hours logged last week?",
@@ -591,40 +754,64 @@ def test_questions():
         "How many vacation days has each Alpha team member taken since the beginning of the year?"
     ]
     
-    try:
-        config = load_config()
-        validate_config(config)
-        
-        print_header("Running Test Questions")
-        print_info(f"Testing {len(test_questions_list)} questions...\n")
-        
-        for i, question in enumerate(test_questions_list, 1):
-            print_header(f"Test Question {i}/{len(test_questions_list)}")
-            print(f"{Colors.BOLD}Question:{Colors.ENDC} {question}")
-            
-            start_time = time.time()
-            answer = process_question_with_retry(question, config, debug=False)
-            elapsed_time = time.time() - start_time
+    prewarm_openrouter(config)
+    prewarm_schema(config)
+    
+    _set_debug(False)
+    print_header("Running Test Questions")
+    print_info(f"Testing {len(test_questions_list)} questions...\n")
+    
+    def run(question):
+        start_time = time.perf_counter()
+        # Step-by-step progress from concurrent questions would interleave;
+        # each question is reported whole once it finishes
+        answer = process_question_with_retry(question, config, debug=False, progress=False)
+        return answer, time.perf_counter() - start_time
+    
+    # The questions are independent and IO-bound; run them concurrently
+    # within the LLM concurrency budget and report each as it finishes
+    total = len(test_questions_list)
+    workers = min(total, config.get('llm_max_concurrency', 4))
+    # One file per run, written as results arrive so an interrupted run keeps them
+    with (open(output, 'w', encoding='utf-8') if output else nullcontext()) as file, \
+         ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, question): (i, question) for i, question in enumerate(test_questions_list, 1)}
+        for future in as_completed(futures):
+            i, question = futures[future]
+            answer, elapsed_time = future.result()
             
+            print_header(f"Test Question {i}/{total}")
+            print(f"{Colors.BOLD}Question:{Colors.ENDC} {question}")
             print(f"{Colors.BOLD}Answer:{Colors.ENDC} {answer}")
             print_info(f"Processing time: {elapsed_time:.2f}s")
             print("-" * 80)
             
-        print_success("All test questions completed!")
+            if file is not None:
+                record = {'index': i, 'question': question, 'answer': answer, 'elapsed': round(elapsed_time, 3)}
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                file.flush()
         
-    except Exception as e:
-        print_error(f"Test questions failed: {e}")
-        if "Missing required configuration" in str(e):
-            print_info("💡 Tip: Copy .env.example to .env and fill in your database and API credentials")
+    print_success("All test questions completed!")
 
 @cli.command()
 def status():
     """Show system status and health check."""
+    from database import test_connection, get_schema
+    from llm import test_openrouter
+    from vacation import load_vacation_data
     print_header("SQL Agent System Status")
     
     try:
         config = load_config()
         
+        # The checks are independent and IO-bound, so run them concurrently
+        # and report the results in order
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            db_future = executor.submit(test_connection, config)
+            schema_future = executor.submit(get_schema, config)
+            llm_future = executor.submit(test_openrouter, config)
+            vacation_future = executor.submit(load_vacation_data)
+        
         # Test configuration
         try:
             validate_config(config)
@@ -634,11 +821,11 @@ def status():
         
         # Test database connection
         try:
-            if test_connection(config):
+            if db_future.result():
                 print_success("Database connection: Connected")
                 
                 # Get schema info
-                schema = get_schema(config)
+                schema = schema_future.result()
                 if schema:
                     print_info(f"Database schema: {len(schema)} tables available")
                     table_names = ", ".join(sorted(schema.keys()))
@@ -652,7 +839,7 @@ def status():
         
         # Test LLM API
         try:
-            if test_openrouter(config):
+            if llm_future.result():
                 print_success("LLM API: Connected")
                 model = config.get('llm_model', 'anthropic/claude-3.5-sonnet')
                 print_info(f"LLM model: {model}")
@@ -663,7 +850,7 @@ def status():
         
         # Test vacation data
         try:
-            vacation_data = load_vacation_data()
+            vacation_data = vacation_future.result()
             if vacation_data:
                 users = vacation_data.get('n_users', 0)
                 requests = vacation_data.get('n_requests', 0)
@@ -3,20 +3,42 @@ Simple testing framework for SQL Agent.
 Tests core functionality without external dependencies.
 """
 
+import asyncio
+import io
+import json
+import os
+import subprocess
+import tempfile
+import threading
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from types import SimpleNamespace
 from typing import List, Tuple
+import requests
+try:
+    import pytest
+except ImportError:
+    pytest = None
 
-# Import project modules
+# Import project modules; database and llm are also used as modules, so
+# their test_* connectivity checks are not collected as tests by pytest
+import database
+import llm
 from config import load_config, validate_config
-from database import test_connection, get_schema, execute_query, is_safe_sql, add_limit_if_needed, get_vacation_info
-from llm import test_openrouter, generate_sql, generate_response, fix_sql_error, clean_sql_response
+from database import get_schema, execute_query, is_safe_sql, add_limit_if_needed, get_vacation_info
+from llm import generate_sql, generate_response, fix_sql_error, clean_sql_response, parse_sql_batch, _language_instruction
 from vacation import load_vacation_data, match_vacation_users, calculate_vacation_days
-from utils import is_safe_query, clean_sql
-from main import process_question, is_vacation_question
+from utils import TransientError, is_safe_query, clean_sql
+from cache import question_key, get_cached_sql, cache_sql, clear_cache, sync_sql_store
+from main import process_question, process_question_with_retry, is_vacation_question, RetryConfig
 
 class TestResult:
     """Simple test result class."""
+    __test__ = False  # not a pytest test class
+    __slots__ = ('name', 'passed', 'message', 'duration')
+    
     def __init__(self, name: str, passed: bool, message: str = "", duration: float = 0.0):
         self.name = name
         self.passed = passed
@@ -25,27 +47,30 @@ class TestResult:
 
 class TestRunner:
     """Simple test runner class."""
+    __test__ = False  # not a pytest test class
+    
     def __init__(self):
         self.results: List[TestResult] = []
         self.config = None
+        self.config_valid = False
     
     def run_test(self, test_name: str, test_func):
         """Run a single test function."""
         print(f"Running {test_name}...", end=" ")
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             test_func()
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             self.results.append(TestResult(test_name, True, "PASSED", duration))
             print("✓ PASSED")
         except AssertionError as e:
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             message = str(e) if str(e) else "Assertion failed"
             self.results.append(TestResult(test_name, False, f"FAILED: {message}", duration))
             print(f"✗ FAILED: {message}")
         except Exception as e:
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             message = f"Error: {str(e)}"
             self.results.append(TestResult(test_name, False, message, duration))
             print(f"✗ ERROR: {e}")
@@ -54,7 +79,11 @@ class TestRunner:
         """Load configuration for testing."""
         try:
             self.config = load_config()
-            # Don't validate config - let individual tests handle missing credentials
+            # Validate once here; tests that need credentials check config_valid
+            try:
+                self.config_valid = validate_config(self.config)
+            except ValueError as e:
+                print(f"Note: {e}")
             return True
         except Exception as e:
             print(f"Warning: Could not load config: {e}")
@@ -86,55 +115,55 @@ class TestRunner:
         
         return failed == 0
 
+if pytest is not None:
+    # The same test functions also run under pytest (`pytest test.py`, or
+    # `pytest -n auto test.py` with xdist); tests that take the runner get
+    # one shared, config-loaded instance
+    @pytest.fixture(scope="session")
+    def runner():
+        runner = TestRunner()
+        runner.load_test_config()
+        return runner
+
 def test_database_connection(runner):
     """Test database connectivity."""
     if not runner.config:
         # Test without config should fail gracefully
         assert False, "No configuration available"
     
-    try:
-        validate_config(runner.config)
-        # If config is valid, test connection
-        result = test_connection(runner.config)
-        assert result, "Database connection failed"
-    except ValueError as e:
-        if "Missing required configuration" in str(e):
-            # This is expected when DB credentials are missing
-            print("(Expected failure - no DB credentials)")
-            return
-        raise
+    if not runner.config_valid:
+        # This is expected when DB credentials are missing
+        print("(Expected failure - no DB credentials)")
+        return
+    
+    result = database.test_connection(runner.config)
+    assert result, "Database connection failed"
 
 def test_schema_retrieval(runner):
     """Test database schema retrieval."""
     if not runner.config:
         assert False, "No configuration available"
     
-    try:
-        validate_config(runner.config)
-        schema = get_schema(runner.config)
-        assert schema is not None, "Schema retrieval failed"
-        assert isinstance(schema, dict), "Schema should be a dictionary"
-        assert len(schema) > 0, "Schema should contain tables"
-    except ValueError as e:
-        if "Missing required configuration" in str(e):
-            print("(Expected failure - no DB credentials)")
-            return
-        raise
+    if not runner.config_valid:
+        print("(Expected failure - no DB credentials)")
+        return
+    
+    schema = get_schema(runner.config)
+    assert schema is not None, "Schema retrieval failed"
+    assert isinstance(schema, dict), "Schema should be a dictionary"
+    assert len(schema) > 0, "Schema should contain tables"
 
 def test_llm_connection(runner):
     """Test OpenRouter API connection."""
     if not runner.config:
         assert False, "No configuration available"
     
-    try:
-        validate_config(runner.config)
-        result = test_openrouter(runner.config)
-        assert result, "OpenRouter API connection failed"
-    except ValueError as e:
-        if "Missing required configuration" in str(e):
-            print("(Expected failure - no API key)")
-            return
-        raise
+    if not runner.config_valid:
+        print("(Expected failure - no API key)")
+        return
+    
+    result = llm.test_openrouter(runner.config)
+    assert result, "OpenRouter API connection failed"
 
 def test_sql_safety():
     """Test SQL safety validation functions."""
@@ -178,6 +207,41 @@ def test_limit_protection():
     assert "LIMIT 50" in result, "Should preserve existing LIMIT"
     assert result.count("LIMIT") == 1, "Should not add duplicate LIMIT"
     
+    # Test LIMIT with OFFSET and a trailing semicolon is preserved
+    query_with_offset = "SELECT * FROM users LIMIT 50 OFFSET 10;"
+    assert add_limit_if_needed(query_with_offset) == query_with_offset, "Should preserve LIMIT with OFFSET"
+    
+    # Test LIMIT ALL and a LIMIT followed by a comment are preserved
+    for query in ("SELECT * FROM users LIMIT ALL", "SELECT * FROM users LIMIT 10 -- first page",
+                  "SELECT * FROM users\nLIMIT 10; -- first page\n-- by name",
+                  "SELECT * FROM users LIMIT 10 -- " + "x" * 250):
+        assert add_limit_if_needed(query) == query, f"Should preserve existing LIMIT: {query}"
+    
+    # Test an added LIMIT goes before the trailing semicolon and comments
+    for query, expected in (
+        ("SELECT * FROM users -- all of them", "SELECT * FROM users LIMIT 1000 -- all of them"),
+        ("SELECT * FROM users; -- all users", "SELECT * FROM users LIMIT 1000; -- all users"),
+        ("SELECT * FROM users;\n-- all users", "SELECT * FROM users LIMIT 1000;\n-- all users"),
+        ("SELECT * FROM t WHERE note = 'a--b'", "SELECT * FROM t WHERE note = 'a--b' LIMIT 1000"),
+    ):
+        assert add_limit_if_needed(query) == expected, f"Should add LIMIT inside the statement: {query}"
+    
+    # Test a long dashed comment followed by more SQL is checked in linear time;
+    # the regex engine holds the GIL, so the bound is enforced on a subprocess
+    query = "SELECT * FROM users LIMIT 10 " + "-" * 60 + "\nORDER BY name"
+    try:
+        subprocess.run(
+            [sys.executable, "-c", f"from database import add_limit_if_needed; add_limit_if_needed({query!r})"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10, check=True
+        )
+    except subprocess.TimeoutExpired:
+        assert False, "LIMIT detection should not backtrack on long comments"
+    assert add_limit_if_needed(query).endswith("ORDER BY name LIMIT 1000"), "Should add LIMIT after the last clause"
+    
+    # Test LIMIT appearing inside identifiers or literals is not treated as a clause
+    result = add_limit_if_needed("SELECT rate_limit FROM plans WHERE note = 'NO LIMIT'")
+    assert result.endswith("LIMIT 1000"), "Should add LIMIT when only identifiers mention it"
+    
     # Test non-SELECT queries are not modified
     non_select = "INSERT INTO users VALUES (1)"
     result = add_limit_if_needed(non_select)
@@ -208,6 +272,8 @@ def test_vacation_question_detection():
         "Who is on holiday this week?",
         "Show me sick leave for the team",
         "Скільки днів відпустки у Петра?",  # Ukrainian
+        "ХТО ЗАРАЗ НА ЛІКАРНЯНОМУ?",  # Ukrainian, upper case
+        "Сколько дней отпуска у команды?",  # Russian
         "What is the leave policy?"
     ]
     
@@ -235,38 +301,445 @@ SELECT * FROM users;
     assert "SELECT * FROM users;" in cleaned, "Should preserve SQL content"
     assert "```" not in cleaned, "Should remove markdown"
     
+    # Test fences tagged with other SQL dialect names
+    for tag in ("postgresql", "pgsql", "postgres", "SQL", ""):
+        cleaned = clean_sql_response(f"```{tag}\nSELECT 1;\n```")
+        assert cleaned == "SELECT 1;", f"Should drop the ```{tag} fence line"
+    
     # Test prefix removal
     sql_with_prefix = "SQL Query: SELECT COUNT(*) FROM employees;"
     cleaned = clean_sql_response(sql_with_prefix)
     assert cleaned == "SELECT COUNT(*) FROM employees;", "Should remove prefix"
     
+    # Test batched responses map back to question order
+    batched = "--- SQL 2 ---\nSELECT 2;\n--- SQL 1 ---\n```sql\nSELECT 1;\n```"
+    assert parse_sql_batch(batched, 3) == ["SELECT 1;", "SELECT 2;", None], "Should split batched SQL"
+    
     # Test basic SQL cleaning
     messy_sql = "  SELECT * FROM users  "
     cleaned = clean_sql(messy_sql)
     assert cleaned.strip() == "SELECT * FROM users", "Should clean whitespace"
 
+def test_language_detection():
+    """Test response language selection from question text."""
+    assert _language_instruction('auto', "Скільки днів відпустки?") == "Please respond in Ukrainian.", "Should detect Ukrainian"
+    assert _language_instruction('auto', "How many vacation days?") == "Please respond in English.", "Should default to English"
+    assert _language_instruction('english', "Скільки днів?") == "Please respond in English.", "Explicit language should win"
+
+def test_question_cache():
+    """Test question normalization and SQL caching."""
+    schema = {'employee': [{'column': 'name', 'type': 'varchar', 'nullable': 'NO'}]}
+    
+    # Case, whitespace and trailing punctuation should not change the key
+    key = question_key("How many employees?", schema)
+    assert key == question_key("  how many   EMPLOYEES ", schema), "Should normalize question"
+    assert key != question_key("How many teams?", schema), "Different questions should differ"
+    assert key != question_key("How many employees?", {}), "Schema should be part of the key"
+    
+    config = {'query_cache_ttl': 300, 'query_cache_size': 2}
+    clear_cache()
+    cache_sql(config, key, "SELECT COUNT(*) FROM employee")
+    assert get_cached_sql(config, key) == "SELECT COUNT(*) FROM employee", "Should return cached SQL"
+    
+    # Oldest entries are evicted beyond the configured size
+    cache_sql(config, 'second', "SELECT 2")
+    cache_sql(config, 'third', "SELECT 3")
+    assert get_cached_sql(config, key) is None, "Should evict least recently used entry"
+    
+    # A zero TTL disables caching
+    assert get_cached_sql({'query_cache_ttl': 0}, 'third') is None, "Should bypass cache when disabled"
+    
+    # Concurrent lookups and evictions must not corrupt the cache
+    def churn(n):
+        for i in range(2000):
+            cache_sql(config, str(i % 5), f"SELECT {n}")
+            get_cached_sql(config, str((i + n) % 5))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(churn, range(8)))
+    clear_cache()
+    
+    # On-disk SQL survives a restart but not a change to the live schema
+    with tempfile.TemporaryDirectory() as directory:
+        config = {'query_cache_ttl': 300, 'query_cache_path': os.path.join(directory, "sql.db")}
+        sync_sql_store(config, schema)
+        cache_sql(config, key, "SELECT COUNT(*) FROM employee")
+        clear_cache()
+        sync_sql_store(config, schema)
+        assert get_cached_sql(config, key) == "SELECT COUNT(*) FROM employee", "Should read SQL from disk"
+        clear_cache()
+        sync_sql_store(config, {**schema, 'team': []})
+        assert get_cached_sql(config, key) is None, "Should drop SQL generated for an older schema"
+        clear_cache()
+
+def test_schema_refresh():
+    """Test that a schema refresh clears cached SQL only when the schema changed."""
+    config = {'db_host': 'test', 'db_port': 0, 'db_name': 'refresh', 'schema_cache_ttl': 0,
+              'query_cache_ttl': 300, 'query_cache_size': 16}
+    columns = [{'table_name': 'employee', 'column_name': 'name', 'data_type': 'text', 'is_nullable': 'NO'}]
+    @contextmanager
+    def connection(config):
+        yield None
+    clear_cache()
+    with patched(database, pooled_connection=connection, _execute_prepared=lambda conn, name, sql: list(columns)):
+        schema = database.get_schema(config)
+        cache_sql(config, "key", "SELECT name FROM employee")
+        assert database.get_schema(config) is schema, "Should keep the same dict for an unchanged schema"
+        assert get_cached_sql(config, "key"), "Should keep cached SQL for an unchanged schema"
+        columns.append({'table_name': 'team', 'column_name': 'name', 'data_type': 'text', 'is_nullable': 'NO'})
+        assert 'team' in database.get_schema(config), "Should pick up the changed schema"
+        assert get_cached_sql(config, "key") is None, "Should drop cached SQL once the schema changed"
+    database.invalidate_schema(config)
+
+@contextmanager
+def patched(module, **replacements):
+    """Temporarily replace attributes of a module."""
+    originals = {name: getattr(module, name) for name in replacements}
+    try:
+        for name, value in replacements.items():
+            setattr(module, name, value)
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(module, name, value)
+
+def llm_reply(content):
+    """Build a successful call_openrouter result with the given message content."""
+    return {'choices': [{'message': {'content': content}}]}
+
+def fake_stream(*chunks, completed=True, error=None):
+    """Stand-in for stream_openrouter: yields chunks, then raises error or reports whether the model finished."""
+    yield from chunks
+    if error is not None:
+        raise error
+    return completed
+
+def test_streamed_answer_retry():
+    """Test that a transiently failed answer stream is retried instead of shown."""
+    config = {'query_cache_ttl': 0, 'llm_max_prompt_tokens': 4000}
+    streams = iter([fake_stream(error=TransientError("Connection error")), fake_stream("Answer: ", "One employee.")])
+    shown = []
+    with patched(database,
+                 get_schema=lambda config: {'employee': []},
+                 get_schema_prompt=lambda config: "employee(name)",
+                 execute_query=lambda config, sql, max_rows=None: [{'name': 'Ann'}]), \
+         patched(llm,
+                 generate_sql=lambda config, question, schema: "SELECT name FROM employee",
+                 stream_openrouter=lambda config, messages: next(streams)):
+        answer = process_question_with_retry(
+            "Who works here?", config, on_chunk=shown.append,
+            retry=RetryConfig(initial_delay=0, jitter=0)
+        )
+    assert answer == "One employee.", f"Should retry the failed stream, got: {answer}"
+    assert ''.join(shown) == "One employee.", "Failure text should not reach on_chunk"
+
+def test_persistent_failure_not_retried():
+    """Test that only failures marked transient are retried."""
+    calls = []
+    def generate(config, question, schema):
+        calls.append(question)
+        if len(calls) == 1:
+            raise TransientError("Rate limit exceeded")
+        return None
+    with patched(database,
+                 get_schema=lambda config: {'employee': []},
+                 get_schema_prompt=lambda config: "employee(name)"), \
+         patched(llm, generate_sql=generate):
+        answer = process_question_with_retry(
+            "Who works here?", {}, retry=RetryConfig(max_retries=3, initial_delay=0, jitter=0)
+        )
+    assert answer.startswith("Error: Unable to generate SQL query"), f"Should report the failure, got: {answer}"
+    assert len(calls) == 2, f"Should retry the rate limit but not the failed generation, got {len(calls)} calls"
+
+def test_no_fix_after_success():
+    """Test that SQL which runs successfully gets no correction call, however it looks."""
+    calls = []
+    def call(config, messages, response_format=None):
+        calls.append(messages)
+        return llm_reply("SELECT 1")
+    with patched(database,
+                 get_schema=lambda config: {'employee': []},
+                 get_schema_prompt=lambda config: "employee(name)",
+                 execute_query=lambda config, sql, max_rows=None: [{'count': 1}]), \
+         patched(llm,
+                 generate_sql=lambda config, question, schema: "SELECT (1; SELECT 2",
+                 generate_response=lambda config, question, data: "One.",
+                 call_openrouter=call):
+        answer = process_question("How many?", {})
+    assert answer == "One.", f"Should answer from the first attempt, got: {answer}"
+    assert not calls, "Should not request a SQL fix when the query succeeded"
+
+def test_decomposed_generation():
+    """Test question decomposition with concurrent SQL generation and execution."""
+    config = {'query_cache_ttl': 0, 'llm_stream': False}
+    def call(config, messages, response_format=None):
+        prompt = messages[0]['content']
+        if 'Sub-questions:' in prompt:
+            return llm_reply('```json\n["How many teams?", "How many projects?"]\n```')
+        table = 'team' if 'How many teams?' in prompt else 'project'
+        return llm_reply(f"```sql\nSELECT COUNT(*) FROM {table};\n```")
+    with patched(llm, call_openrouter=call):
+        parts = llm.generate_decomposed(config, "How many teams and projects are there?", "schema")
+    assert parts == [
+        {'question': "How many teams?", 'sql': "SELECT COUNT(*) FROM team;"},
+        {'question': "How many projects?", 'sql': "SELECT COUNT(*) FROM project;"},
+    ], f"Should generate SQL per sub-question in order, got: {parts}"
+    
+    # Results come back in query order even when later queries finish first
+    def execute(config, sql, max_rows=None):
+        time.sleep(0.02 if 'team' in sql else 0)
+        return [{'sql': sql}]
+    with patched(database, execute_query=execute):
+        results = database.execute_queries({'db_pool_size': 4}, [part['sql'] for part in parts])
+    assert [rows[0]['sql'] for rows in results] == [part['sql'] for part in parts], "Should keep query order"
+
+def test_async_wrappers():
+    """Test that the async LLM wrappers can be awaited together."""
+    config = {'query_cache_ttl': 0, 'llm_stream': False, 'llm_max_prompt_tokens': 4000}
+    # Each call waits at the barrier until all three are in flight, so the
+    # gather only completes if the calls actually overlap
+    barrier = threading.Barrier(3, timeout=5)
+    def call(config, messages, response_format=None):
+        barrier.wait()
+        prompt = messages[0]['content']
+        if 'Corrected SQL:' in prompt:
+            return llm_reply("SELECT 1;")
+        if 'Query Results:' in prompt:
+            return llm_reply("Answer: One row.")
+        return llm_reply("```sql\nSELECT 2;\n```")
+    async def gather():
+        return await asyncio.gather(
+            llm.agenerate_sql(config, "How many teams?", "schema"),
+            llm.agenerate_response(config, "How many teams?", [{'count': 2}]),
+            llm.afix_sql_error(config, "SELECT (1", "syntax error", "schema"),
+        )
+    with patched(llm, call_openrouter=call):
+        results = asyncio.run(gather())
+    assert not barrier.broken, "Calls should overlap"
+    assert results == ["SELECT 2;", "One row.", "SELECT 1;"], f"Unexpected results: {results}"
+
+def test_sql_batch_generation():
+    """Test batched SQL generation with cached and individually retried questions."""
+    config = {'query_cache_ttl': 300, 'query_cache_size': 16, 'llm_stream': False}
+    questions = ["How many teams?", "How many projects?", "How many tasks?", "How many employees?"]
+    clear_cache()
+    cache_sql(config, question_key(questions[0], "schema"), "SELECT 0;")
+    prompts = []
+    def call(config, messages, response_format=None):
+        prompt = messages[0]['content']
+        prompts.append(prompt)
+        if 'SQL Queries:' in prompt:
+            # Only the three uncached questions are numbered; the model skips the last
+            return llm_reply("--- SQL 1 ---\nSELECT 1;\n--- SQL 2 ---\nSELECT 2;")
+        return llm_reply("SELECT 3;")
+    with patched(llm, call_openrouter=call):
+        sqls = llm.generate_sql_batch(config, questions, "schema")
+    clear_cache()
+    assert sqls == ["SELECT 0;", "SELECT 1;", "SELECT 2;", "SELECT 3;"], f"Unexpected SQL: {sqls}"
+    assert len(prompts) == 2, "Should send one batch prompt plus one retry"
+    assert questions[0] not in prompts[0], "Cached question should not be sent"
+
+def test_run_batch():
+    """Test rate-limited concurrent SQL generation."""
+    config = {'openrouter_api_key': 'test', 'query_cache_ttl': 0}
+    questions = [f"How many tasks in project {i}?" for i in range(6)]
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0, 'limited': False}
+    def call(config, messages, response_format=None):
+        prompt = messages[0]['content']
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            limit = 'project 0?' in prompt and not state['limited']
+            state['limited'] = state['limited'] or limit
+        time.sleep(0.02)
+        with lock:
+            state['active'] -= 1
+        if limit:
+            return {'error': llm._RATE_LIMIT_ERROR}
+        number = prompt.split('in project ')[1][0]
+        return llm_reply(f"SELECT {number};")
+    with patched(llm, call_openrouter=call, _BATCH_BACKOFF_BASE=0):
+        sqls = llm.run_batch(config, questions, "schema", max_concurrency=2)
+    assert sqls == [f"SELECT {i};" for i in range(6)], f"Unexpected SQL: {sqls}"
+    assert state['limited'], "Should have hit the rate limit once"
+    assert state['peak'] <= 2, f"Should cap concurrency, saw {state['peak']} calls at once"
+    
+    # A 1200 rpm bucket holding one token spaces three calls 50ms apart;
+    # a fake clock that only moves on sleep keeps this independent of timing
+    clock = [0.0]
+    sleeps = []
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        clock[0] += delay
+    async def acquire_three():
+        limiter = llm._RateLimiter(1200, 1)
+        for _ in range(3):
+            await limiter.acquire()
+    with patched(llm, time=SimpleNamespace(monotonic=lambda: clock[0])), patched(asyncio, sleep=fake_sleep):
+        asyncio.run(acquire_three())
+    assert len(sleeps) == 2, f"Should wait before the second and third calls, slept {sleeps}"
+    assert abs(sum(sleeps) - 0.1) < 1e-9, f"Should wait for tokens to refill, slept {sum(sleeps):.3f}s"
+
+def write_snapshot(directory, n_requests):
+    """Write a small ClickUp snapshot file and return its path."""
+    statuses = ("open", "approved")
+    snapshot = {
+        'n_users': 1,
+        'n_requests': n_requests,
+        'users': [{
+            'id': 1, 'username': " ann ", 'email': "ann@anadea.info", 'initials': "A",
+            'role': "member", 'date_joined': "2024-01-01T00:00:00Z"
+        }],
+        'requests': [{
+            'id': f"86a{i}", 'name': "Vacation", 'description': None, 'status': statuses[i % 2],
+            'url': f"https://app.clickup.com/t/86a{i}", 'start_date': "2025-01-01T00:00:00Z",
+            'due_date': "2025-01-02T00:00:00Z", 'type': "Vacation", 'requester': 1,
+            'assignees_ids': [1], 'date_created': "2024-12-01T00:00:00Z",
+            'date_updated': "2024-12-01T00:00:00Z", 'date_closed': None
+        } for i in range(n_requests)]
+    }
+    path = os.path.join(directory, "snapshot.json")
+    with open(path, 'w') as f:
+        json.dump(snapshot, f)
+    return path
+
+def test_snapshot_loading():
+    """Test validating a ClickUp snapshot file."""
+    from vacation_requests import Snapshot
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = Snapshot.from_file(write_snapshot(directory, 3))
+        assert snapshot.n_requests == len(snapshot.requests) == 3, "Should load every request"
+        assert snapshot.users[0].username == "ann", "Should strip usernames"
+        assert snapshot.requests[1].start_date.year == 2025, "Should parse dates"
+    
+    # Subdomain addresses are Anadea's too; other domains keep the custom error
+    from vacation_requests import ClickUpUser
+    user = {'id': 2, 'username': "bob", 'initials': "B", 'role': "member", 'date_joined': "2024-01-01T00:00:00Z"}
+    assert ClickUpUser(email="bob@team.anadea.info", **user).email == "bob@team.anadea.info", "Should accept subdomains"
+    try:
+        ClickUpUser(email="bob@notanadea.info", **user)
+        assert False, "Should reject other domains"
+    except ValueError as e:
+        assert "not Anadea's email" in str(e), f"Should keep the custom message, got: {e}"
+
+def test_snapshot_arrays():
+    """Test the column-wise view of snapshot requests."""
+    from vacation_requests import Snapshot
+    with tempfile.TemporaryDirectory() as directory:
+        arrays = Snapshot.from_file(write_snapshot(directory, 3)).to_arrays()
+    assert list(arrays.status_code) == [0, 1, 0], "Should code statuses in order of appearance"
+    assert arrays.statuses == ("open", "approved"), "Should keep the status vocabulary"
+    assert sum(arrays.statuses[code] == "open" for code in arrays.status_code) == 2, "Codes should map back"
+    assert arrays.start_date_ms[0] == 1735689600000, "Should store start dates as epoch milliseconds"
+    assert list(arrays.requester) == [1, 1, 1], "Should keep requester IDs"
+
+class FakeStreamResponse:
+    """Minimal streamed requests.Response replaying SSE lines, then optionally failing."""
+    status_code = 200
+    
+    def __init__(self, lines, error=None):
+        self.lines = lines
+        self.error = error
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def iter_lines(self):
+        yield from self.lines
+        if self.error is not None:
+            raise self.error
+
+def sse_lines(*contents, finish_reason='stop'):
+    """SSE data lines streaming contents, ending with finish_reason and [DONE] unless it is None."""
+    lines = [b'data: ' + json.dumps({'choices': [{'delta': {'content': c}}]}).encode() for c in contents]
+    if finish_reason is not None:
+        lines.append(b'data: ' + json.dumps({'choices': [{'delta': {}, 'finish_reason': finish_reason}]}).encode())
+        lines.append(b'data: [DONE]')
+    return lines
+
+def stream_client(response):
+    """LLMClient whose session answers every streamed POST with response."""
+    class Session:
+        def post(self, *args, **kwargs):
+            return response
+    return llm.LLMClient(session=Session(), headers={}, model='test', timeout=1, max_tokens=100, debug=False)
+
+def test_interrupted_sql_stream():
+    """Test that SQL from a stream cut short is discarded and not cached."""
+    config = {'query_cache_ttl': 300, 'query_cache_size': 16}
+    question = "Who works here?"
+    clear_cache()
+    dropped = FakeStreamResponse(sse_lines("```sql\nSELECT name FR", finish_reason=None),
+                                 error=requests.exceptions.ConnectionError())
+    with patched(llm, get_llm_client=lambda config: stream_client(dropped)):
+        assert generate_sql(config, question, "schema") is None, "Should discard partial SQL"
+    assert get_cached_sql(config, question_key(question, "schema")) is None, "Should not cache partial SQL"
+    
+    complete = FakeStreamResponse(sse_lines("```sql\nSELECT name ", "FROM employee;\n```"))
+    with patched(llm, get_llm_client=lambda config: stream_client(complete)):
+        assert generate_sql(config, question, "schema") == "SELECT name FROM employee;", "Should use complete SQL"
+    assert get_cached_sql(config, question_key(question, "schema")), "Should cache complete SQL"
+    clear_cache()
+
+def test_interrupted_answer_stream():
+    """Test that an answer cut off mid-stream is flagged and not cached."""
+    config = {'query_cache_ttl': 300, 'query_cache_size': 16, 'llm_max_prompt_tokens': 4000}
+    rows = [{'name': 'Ann'}]
+    clear_cache()
+    streams = iter([fake_stream("Answer: Ann works in the ", completed=False), fake_stream("Ann works in the Alpha team.")])
+    with patched(llm, stream_openrouter=lambda config, messages: next(streams)):
+        partial = ''.join(llm.generate_response_stream(config, "Who works here?", rows))
+        complete = ''.join(llm.generate_response_stream(config, "Who works here?", rows))
+    clear_cache()
+    assert partial.startswith("Ann works in the") and partial.endswith(llm._ANSWER_CUT_OFF_NOTICE), \
+        f"Should flag the cut-off answer, got: {partial!r}"
+    assert complete == "Ann works in the Alpha team.", f"Cut-off answer should not be cached, got: {complete!r}"
+
+def test_row_iterator_preview():
+    """Test that an iterator of rows is read only as far as the answer prompt needs."""
+    rows = iter([{'id': i} for i in range(50)])
+    prompt, _ = llm._response_prompt({'llm_max_prompt_tokens': 4000}, "Which ids exist?", rows)
+    assert "... and more rows" in prompt, "Should say more rows exist"
+    assert next(rows) == {'id': llm._PROMPT_PREVIEW_ROWS + 1}, "Should stop one row past the preview"
+
+def test_stream_http_error():
+    """Test that a streamed call reports the same HTTP error details as a plain call."""
+    rejected = FakeStreamResponse([])
+    rejected.status_code = 401
+    output = io.StringIO()
+    with patched(llm, get_llm_client=lambda config: stream_client(rejected)), redirect_stdout(output):
+        assert list(llm.stream_openrouter({}, [])) == [], "Should yield nothing for a rejected call"
+    assert "Invalid API key" in output.getvalue(), f"Should name the 401 cause, got: {output.getvalue()!r}"
+
+def test_session_pool_growth():
+    """Test that the shared session's pool grows to the largest requested concurrency."""
+    with patched(llm, _SESSION=None, _SESSION_POOL_SIZE=0):
+        session = llm._session()
+        assert llm._session(64) is session, "Should keep one shared session"
+        assert session.get_adapter(llm.OPENROUTER_URL)._pool_maxsize == 64, "Should remount a larger pool"
+        llm._session(8)
+        assert session.get_adapter(llm.OPENROUTER_URL)._pool_maxsize == 64, "Should never shrink the pool"
+
 def test_end_to_end_processing(runner):
     """Test complete question processing pipeline."""
     if not runner.config:
         assert False, "No configuration available"
     
-    try:
-        validate_config(runner.config)
-        
-        # Test with a simple question
-        question = "How many employees are there?"
-        result = process_question(question, runner.config, debug=False)
-        
-        # Should return some result (even if it's an error message)
-        assert result is not None, "Should return a result"
-        assert isinstance(result, str), "Result should be a string"
-        assert len(result) > 0, "Result should not be empty"
-        
-    except ValueError as e:
-        if "Missing required configuration" in str(e):
-            print("(Expected failure - no credentials)")
-            return
-        raise
+    if not runner.config_valid:
+        print("(Expected failure - no credentials)")
+        return
+    
+    # Test with a simple question
+    question = "How many employees are there?"
+    result = process_question(question, runner.config, debug=False)
+    
+    # Should return some result (even if it's an error message)
+    assert result is not None, "Should return a result"
+    assert isinstance(result, str), "Result should be a string"
+    assert len(result) > 0, "Result should not be empty"
 
 def test_required_questions(runner):
     """Test the 4 specific required questions."""
@@ -274,13 +747,9 @@ def test_required_questions(runner):
         print("(Skipped - no configuration)")
         return
     
-    try:
-        validate_config(runner.config)
-    except ValueError as e:
-        if "Missing required configuration" in str(e):
-            print("(Expected failure - no credentials)")
-            return
-        raise
+    if not runner.config_valid:
+        print("(Expected failure - no credentials)")
+        return
     
     required_questions = [
         "How much on average do task estimates exceed actual time spent for Alpha team?",
@@ -289,9 +758,21 @@ def test_required_questions(runner):
         "How many vacation days has each Alpha team member taken since the beginning of the year?"
     ]
     
-    for i, question in enumerate(required_questions, 1):
+    def run(question):
+        try:
+            return process_question(question, runner.config, debug=False), None
+        except Exception as e:
+            return None, e
+    
+    # The questions are independent and IO-bound, so overlap them; results
+    # are checked afterwards in question order
+    with ThreadPoolExecutor(max_workers=len(required_questions)) as executor:
+        outcomes = list(executor.map(run, required_questions))
+    
+    for i, (result, exc) in enumerate(outcomes, 1):
         try:
-            result = process_question(question, runner.config, debug=False)
+            if exc is not None:
+                raise exc
             assert result is not None, f"Question {i} should return a result"
             assert isinstance(result, str), f"Question {i} result should be a string"
             assert len(result) > 0, f"Question {i} result should not be empty"
@@ -333,6 +814,23 @@ def run_all_tests():
     runner.run_test("Vacation Data Loading", test_vacation_loading)
     runner.run_test("Vacation Question Detection", test_vacation_question_detection)
     runner.run_test("SQL Cleaning", test_sql_cleaning)
+    runner.run_test("Language Detection", test_language_detection)
+    runner.run_test("Question Cache", test_question_cache)
+    runner.run_test("Schema Refresh", test_schema_refresh)
+    runner.run_test("Streamed Answer Retry", test_streamed_answer_retry)
+    runner.run_test("Persistent Failure Not Retried", test_persistent_failure_not_retried)
+    runner.run_test("No Fix After Success", test_no_fix_after_success)
+    runner.run_test("Decomposed Generation", test_decomposed_generation)
+    runner.run_test("Async Wrappers", test_async_wrappers)
+    runner.run_test("SQL Batch Generation", test_sql_batch_generation)
+    runner.run_test("Interrupted SQL Stream", test_interrupted_sql_stream)
+    runner.run_test("Interrupted Answer Stream", test_interrupted_answer_stream)
+    runner.run_test("Row Iterator Preview", test_row_iterator_preview)
+    runner.run_test("Stream HTTP Error", test_stream_http_error)
+    runner.run_test("Run Batch", test_run_batch)
+    runner.run_test("Session Pool Growth", test_session_pool_growth)
+    runner.run_test("Snapshot Loading", test_snapshot_loading)
+    runner.run_test("Snapshot Arrays", test_snapshot_arrays)
     runner.run_test("End-to-End Processing", lambda: test_end_to_end_processing(runner))
     runner.run_test("Required Questions", lambda: test_required_questions(runner))
     
@@ -1,57 +1,73 @@
 import re
+import sys
+from functools import lru_cache
 
+class TransientError(Exception):
+    """An LLM or database call failed in a way that may succeed on retry.
+    
+    Raised for rate limits, server overload, timeouts and dropped
+    connections, as opposed to failures a retry would only repeat.
+    """
+
+# Markdown code fences around model output
+_FENCE_SQL_RE = re.compile(r'^```sql\s*', re.IGNORECASE | re.MULTILINE)
+_FENCE_OPEN_RE = re.compile(r'^```\s*', re.MULTILINE)
+_FENCE_CLOSE_RE = re.compile(r'\s*```$', re.MULTILINE)
+
+# Only SELECT statements and WITH clauses (CTE) are allowed
+_READ_ONLY_START_RE = re.compile(r'\s*(?:SELECT|WITH)', re.IGNORECASE)
+
+# Dangerous DDL/DML keywords at statement boundaries, folded into one pass
+_DANGEROUS_RE = re.compile(
+    r'\b(?:DROP\s+(?:TABLE|DATABASE|SCHEMA)|DELETE\s+FROM|INSERT\s+INTO|UPDATE\s+\w+\s+SET'
+    r'|TRUNCATE\s+TABLE|ALTER\s+TABLE|CREATE\s+(?:TABLE|DATABASE|SCHEMA))\b',
+    re.IGNORECASE
+)
+
+# Leading keyword of every _DANGEROUS_RE alternative
+_SUSPECT_TOKENS = ('DROP', 'DELETE', 'INSERT', 'UPDATE', 'TRUNCATE', 'ALTER', 'CREATE')
+
+# Both checks are pure functions of the SQL text, and process_question
+# re-validates the same SQL across retries and fixes, so results are memoized
+
+@lru_cache(maxsize=512)
 def clean_sql(sql):
     """Clean and validate SQL query."""
     if not sql:
         return None
         
     # Remove markdown formatting if present
-    sql = re.sub(r'^```sql\s*', '', sql, flags=re.IGNORECASE | re.MULTILINE)
-    sql = re.sub(r'^```\s*', '', sql, flags=re.IGNORECASE | re.MULTILINE)
-    sql = re.sub(r'\s*```$', '', sql, flags=re.MULTILINE)
+    sql = _FENCE_SQL_RE.sub('', sql)
+    sql = _FENCE_OPEN_RE.sub('', sql)
+    sql = _FENCE_CLOSE_RE.sub('', sql)
     
     # Clean whitespace
     sql = sql.strip()
     
     return sql
 
+@lru_cache(maxsize=512)
 def is_safe_query(sql):
     """Basic safety check for SQL queries."""
     if not sql:
         return False
-        
-    sql_upper = sql.upper().strip()
     
-    # Only allow SELECT statements and WITH clauses (CTE)
-    if not sql_upper.startswith('SELECT') and not sql_upper.startswith('WITH'):
+    if not _READ_ONLY_START_RE.match(sql):
         return False
-        
-    # Block dangerous DDL/DML keywords at statement boundaries
-    dangerous_patterns = [
-        r'\bDROP\s+TABLE\b', r'\bDROP\s+DATABASE\b', r'\bDROP\s+SCHEMA\b',
-        r'\bDELETE\s+FROM\b', r'\bINSERT\s+INTO\b', r'\bUPDATE\s+\w+\s+SET\b',
-        r'\bTRUNCATE\s+TABLE\b', r'\bALTER\s+TABLE\b', r'\bCREATE\s+TABLE\b',
-        r'\bCREATE\s+DATABASE\b', r'\bCREATE\s+SCHEMA\b'
-    ]
     
-    import re
-    for pattern in dangerous_patterns:
-        if re.search(pattern, sql_upper):
-            return False
-            
-    return True
+    # Plain substring scans rule out most queries before the regex runs
+    sql_upper = sql.upper()
+    if not any(token in sql_upper for token in _SUSPECT_TOKENS):
+        return True
+    
+    return not _DANGEROUS_RE.search(sql)
 
 def format_results(data):
     """Format query results for display."""
-    if not data:
-        return "No results found."
-        
-    if isinstance(data, list) and len(data) == 0:
-        return "No results found."
-        
     if isinstance(data, dict) and 'status' in data:
         return f"Operation completed: {data['status']}"
-        
+    if not data:
+        return "No results found."
     return data
 
 def print_table(data):
@@ -66,14 +82,11 @@ def print_table(data):
         print("No columns found.")
         return
         
-    # Print headers
-    print(" | ".join(headers))
-    print("-" * (len(" | ".join(headers))))
+    # Header, separator and rows (limit to first 10), written in one go
+    header_line = " | ".join(headers)
+    lines = [header_line, "-" * len(header_line)]
+    lines.extend(" | ".join([str(row.get(header, '')) for header in headers]) for row in data[:10])
     
-    # Print rows
-    for row in data[:10]:  # Limit to first 10 rows
-        values = [str(row.get(header, '')) for header in headers]
-        print(" | ".join(values))
-        
     if len(data) > 10:
-        print(f"... and {len(data) - 10} more rows")
\ No newline at end of file
+        lines.append(f"... and {len(data) - 10} more rows")
+    sys.stdout.write("\n".join(lines) + "\n")
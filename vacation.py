@@ -1,19 +1,47 @@
 import json
 import os
+import sys
+from collections import defaultdict
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Optional
+from functools import lru_cache
+from typing import Dict, List, Any, Iterable, Optional, Union
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Parses bytes; orjson is optional and several times faster on large files
+_loads = orjson.loads if orjson is not None else json.loads
+
+# ClickUp timestamps end in 'Z', which fromisoformat accepts natively from 3.11
+if sys.version_info >= (3, 11):
+    _parse_timestamp = datetime.fromisoformat
+else:
+    def _parse_timestamp(value: str) -> datetime:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
 
 def load_vacation_data(file_path: str = "vacation_requests.json") -> Optional[Dict[str, Any]]:
-    """Load vacation data from JSON file."""
+    """Load vacation data from JSON file.
+    
+    The parsed file is cached per path and modification time, so an edited
+    file is re-read on the next call; callers must not modify the result.
+    Call load_vacation_data.cache_clear() to force a re-read.
+    """
+    try:
+        mtime = os.path.getmtime(file_path)
+    except OSError:
+        print(f"Warning: Vacation file not found: {file_path}")
+        return None
+    return _load_vacation_data_cached(file_path, mtime)
+
+@lru_cache(maxsize=8)
+def _load_vacation_data_cached(file_path: str, mtime: float) -> Optional[Dict[str, Any]]:
+    """Parse the vacation file; mtime only takes part in the cache key."""
     try:
         print(f"Loading vacation data from {file_path}...")
         
-        if not os.path.exists(file_path):
-            print(f"Warning: Vacation file not found: {file_path}")
-            return None
-        
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        with open(file_path, 'rb') as file:
+            data = _loads(file.read())
         
         if not isinstance(data, dict):
             print("Error: Invalid vacation data format")
@@ -29,13 +57,15 @@ def load_vacation_data(file_path: str = "vacation_requests.json") -> Optional[Di
         
         return data
         
-    except json.JSONDecodeError as e:
+    except json.JSONDecodeError as e:  # orjson's decode error subclasses this
         print(f"Error: Invalid JSON in vacation file: {e}")
         return None
     except Exception as e:
         print(f"Error loading vacation data: {e}")
         return None
 
+load_vacation_data.cache_clear = _load_vacation_data_cached.cache_clear
+
 def match_vacation_users(vacation_data: Dict[str, Any], config: Dict[str, Any]) -> Dict[int, int]:
     """Match ClickUp user IDs to database employee IDs."""
     if not vacation_data:
@@ -56,17 +86,15 @@ def match_vacation_users(vacation_data: Dict[str, Any], config: Dict[str, Any])
             return {}
         
         # Create mapping from ClickUp ID to employee ID
-        user_mapping = {}
-        vacation_users = vacation_data.get('users', [])
+        matched = [
+            db_dev for db_dev in db_developers
+            if db_dev.get('clickup_id') and db_dev.get('developer_id')
+        ]
+        user_mapping = {db_dev['clickup_id']: db_dev['developer_id'] for db_dev in matched}
         
-        for db_dev in db_developers:
-            clickup_id = db_dev.get('clickup_id')
-            employee_id = db_dev.get('developer_id')
-            name = db_dev.get('name', 'Unknown')
-            
-            if clickup_id and employee_id:
-                user_mapping[clickup_id] = employee_id
-                print(f"✓ Mapped ClickUp ID {clickup_id} to employee {employee_id} ({name})")
+        if config.get('debug'):
+            for db_dev in matched:
+                print(f"✓ Mapped ClickUp ID {db_dev['clickup_id']} to employee {db_dev['developer_id']} ({db_dev.get('name', 'Unknown')})")
         
         print(f"✓ Successfully mapped {len(user_mapping)} users")
         return user_mapping
@@ -75,8 +103,13 @@ def match_vacation_users(vacation_data: Dict[str, Any], config: Dict[str, Any])
         print(f"Error matching vacation users: {e}")
         return {}
 
-def calculate_vacation_days(vacation_data: Dict[str, Any], user_mapping: Dict[int, int]) -> Dict[int, Dict[str, Any]]:
-    """Calculate vacation days for each employee."""
+def calculate_vacation_days(vacation_data: Union[Dict[str, Any], Iterable[Dict[str, Any]]], user_mapping: Dict[int, int], verbose: bool = False) -> Dict[int, Dict[str, Any]]:
+    """Calculate vacation days for each employee.
+    
+    vacation_data is the loaded file or any iterable of requests;
+    requests are consumed in a single pass.
+    verbose prints a line per employee.
+    """
     if not vacation_data or not user_mapping:
         print("No data available for vacation calculations")
         return {}
@@ -84,69 +117,56 @@ def calculate_vacation_days(vacation_data: Dict[str, Any], user_mapping: Dict[in
     try:
         print("Calculating vacation days...")
         
-        requests = vacation_data.get('requests', [])
         vacation_summary = {}
         
+        if isinstance(vacation_data, dict):
+            vacation_data = vacation_data.get('requests', [])
+        
+        # Only requests from mapped users count; filter them up front
+        requests = (
+            request for request in vacation_data
+            if request.get('requester') in user_mapping
+        )
+        
         for request in requests:
-            requester_clickup_id = request.get('requester')
-            start_date_str = request.get('start_date')
-            due_date_str = request.get('due_date')
-            vacation_type = request.get('type', 'Unknown')
-            status = request.get('status', 'Unknown')
-            
-            # Skip if user not in mapping
-            if requester_clickup_id not in user_mapping:
-                continue
-            
-            employee_id = user_mapping[requester_clickup_id]
+            employee_id = user_mapping[request['requester']]
             
             # Parse dates
             try:
-                start_date = datetime.fromisoformat(start_date_str.replace('Z', '+00:00'))
-                due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-                
-                # Calculate days
-                days = (due_date - start_date).days + 1  # +1 to include both start and end dates
-                year = start_date.year
-                
-                # Initialize employee summary if not exists
-                if employee_id not in vacation_summary:
-                    vacation_summary[employee_id] = {
-                        'total_days': 0,
-                        'by_year': {},
-                        'by_type': {},
-                        'by_status': {}
-                    }
-                
-                # Update totals
-                vacation_summary[employee_id]['total_days'] += days
-                
-                # Update by year
-                if year not in vacation_summary[employee_id]['by_year']:
-                    vacation_summary[employee_id]['by_year'][year] = 0
-                vacation_summary[employee_id]['by_year'][year] += days
-                
-                # Update by type
-                if vacation_type not in vacation_summary[employee_id]['by_type']:
-                    vacation_summary[employee_id]['by_type'][vacation_type] = 0
-                vacation_summary[employee_id]['by_type'][vacation_type] += days
-                
-                # Update by status
-                if status not in vacation_summary[employee_id]['by_status']:
-                    vacation_summary[employee_id]['by_status'][status] = 0
-                vacation_summary[employee_id]['by_status'][status] += days
-                
-            except (ValueError, TypeError) as e:
+                start_date = _parse_timestamp(request.get('start_date'))
+                due_date = _parse_timestamp(request.get('due_date'))
+            except (ValueError, TypeError, AttributeError) as e:
                 print(f"Warning: Invalid date format in request {request.get('id')}: {e}")
                 continue
+            
+            # Calculate days
+            days = (due_date - start_date).days + 1  # +1 to include both start and end dates
+            
+            summary = vacation_summary.get(employee_id)
+            if summary is None:
+                summary = vacation_summary[employee_id] = {
+                    'total_days': 0,
+                    'by_year': defaultdict(int),
+                    'by_type': defaultdict(int),
+                    'by_status': defaultdict(int)
+                }
+            
+            summary['total_days'] += days
+            summary['by_year'][start_date.year] += days
+            summary['by_type'][request.get('type', 'Unknown')] += days
+            summary['by_status'][request.get('status', 'Unknown')] += days
+        
+        # Hand back plain dicts so lookups of missing keys don't insert them
+        for summary in vacation_summary.values():
+            for field in ('by_year', 'by_type', 'by_status'):
+                summary[field] = dict(summary[field])
         
         print(f"✓ Calculated vacation data for {len(vacation_summary)} employees")
         
-        # Print summary
-        for emp_id, summary in vacation_summary.items():
-            total = summary['total_days']
-            years = list(summary['by_year'].keys())
-            print(f"  Employee {emp_id}: {total} total days across years {years}")
+        if verbose:
+            for emp_id, summary in vacation_summary.items():
+                years = ', '.join(map(str, summary['by_year']))
+                print(f"  Employee {emp_id}: {summary['total_days']} total days across years {years}")
         
         return vacation_summary
         
@@ -1,14 +1,40 @@
 """Pydantic schemas of entities in the corresponding JSON file."""
 
+import re
+import sys
+from array import array
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Annotated, Literal, Optional
+from pathlib import Path
+from typing import Annotated, Literal, Optional, Union
 
-from pydantic import BaseModel, Field, StringConstraints, field_validator
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field, StringConstraints, TypeAdapter, field_validator
 
-ANADEA_DOMAINS = ["anadea.info", "anadeainc.com"]
+ANADEA_DOMAINS = frozenset({"anadea.info", "anadeainc.com"})
 
+# An address at one of the domains or any of their subdomains, checked in one
+# match instead of a loop over the domains
+_ANADEA_EMAIL_RE = re.compile(
+    r".+@(?:[^@]+\.)?(?:%s)" % "|".join(re.escape(domain) for domain in sorted(ANADEA_DOMAINS))
+)
 
-class ClickUpUser(BaseModel):
+# Status and type repeat across thousands of requests but their vocabulary
+# is not fixed, so intern them instead of restricting them to a Literal
+InternedStr = Annotated[str, AfterValidator(sys.intern)]
+
+
+class SnapshotModel(BaseModel):
+    """Base for snapshot entities, which are read-only once loaded.
+
+    The file layout is fixed, so unknown keys are rejected rather than
+    silently dropped, and already-validated instances are never revalidated.
+    Validators are built on first use rather than at import.
+    """
+
+    model_config = ConfigDict(frozen=True, extra="forbid", revalidate_instances="never", defer_build=True)
+
+
+class ClickUpUser(SnapshotModel):
     id: int
     username: Annotated[str, StringConstraints(strip_whitespace=True)]
     email: str
@@ -19,29 +45,92 @@ class ClickUpUser(BaseModel):
     @field_validator("email")
     @classmethod
     def validate_email(cls, value: str) -> str:
-        if not any(value.endswith(domain) for domain in ANADEA_DOMAINS):
+        if _ANADEA_EMAIL_RE.fullmatch(value) is None:
             raise ValueError("not Anadea's email")
         return value
 
 
-class ClickUpVacationRequest(BaseModel):
+class ClickUpVacationRequest(SnapshotModel):
     id: str
     name: Annotated[str, StringConstraints(strip_whitespace=True)]
     description: Annotated[Optional[str], StringConstraints(strip_whitespace=True)]
-    status: str
+    status: InternedStr
     url: str
     start_date: datetime
     due_date: datetime
-    type: str
+    type: InternedStr
     requester: int
-    assignees_ids: list[int] = Field(min_length=1)
+    assignees_ids: tuple[int, ...] = Field(min_length=1)
     date_created: datetime
     date_updated: datetime
     date_closed: Optional[datetime]
 
 
-class Snapshot(BaseModel):
+# Validators for loading users or requests on their own (batches, streamed
+# items), built once here rather than per call
+_USERS_ADAPTER = TypeAdapter(list[ClickUpUser], config=ConfigDict(defer_build=True))
+_REQUESTS_ADAPTER = TypeAdapter(list[ClickUpVacationRequest], config=ConfigDict(defer_build=True))
+
+
+def validate_users_json(data: Union[str, bytes]) -> list[ClickUpUser]:
+    """Validate a JSON array of ClickUp users."""
+    return _USERS_ADAPTER.validate_json(data)
+
+
+def validate_requests_json(data: Union[str, bytes]) -> list[ClickUpVacationRequest]:
+    """Validate a JSON array of ClickUp vacation requests."""
+    return _REQUESTS_ADAPTER.validate_json(data)
+
+
+def _epoch_ms(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+@dataclass(frozen=True)
+class SnapshotArrays:
+    """Column-wise view of snapshot requests for bulk counting and filtering.
+
+    Each array holds one value per request, in the order of
+    Snapshot.requests. Status and type are stored as codes indexing into
+    the statuses and types tuples.
+    """
+
+    start_date_ms: array
+    due_date_ms: array
+    requester: array
+    status_code: array
+    type_code: array
+    statuses: tuple[str, ...]
+    types: tuple[str, ...]
+
+
+class Snapshot(SnapshotModel):
     n_users: int
     n_requests: int
     users: list[ClickUpUser]
     requests: list[ClickUpVacationRequest]
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> "Snapshot":
+        """Validate a snapshot straight from the JSON file's bytes.
+
+        Parsing and validation happen in one pass, without building the
+        intermediate dicts that json.load followed by model_validate would.
+        """
+        return cls.model_validate_json(Path(path).read_bytes())
+
+    def to_arrays(self) -> SnapshotArrays:
+        """Build a column-wise view of the requests."""
+        statuses: dict[str, int] = {}
+        types: dict[str, int] = {}
+        requests = self.requests
+        return SnapshotArrays(
+            start_date_ms=array("q", [_epoch_ms(r.start_date) for r in requests]),
+            due_date_ms=array("q", [_epoch_ms(r.due_date) for r in requests]),
+            requester=array("q", [r.requester for r in requests]),
+            status_code=array("H", [statuses.setdefault(r.status, len(statuses)) for r in requests]),
+            type_code=array("H", [types.setdefault(r.type, len(types)) for r in requests]),
+            statuses=tuple(statuses),
+            types=tuple(types),
+        )
+